@@ -0,0 +1,78 @@
+"""
+Times one enemy turn with 10, 100 and 1000 awake monsters chasing the player across an open arena.
+
+    python -m benchmarks.enemy_turn --repeat 10
+"""
+
+import argparse
+import random
+
+import numpy as np
+
+from entity_store import create_store
+from game_messages import MessageLog
+from game_states import GameStates
+from loader_functions.initialize_new_game import get_constants, get_game_variables
+from map_utils import GameMap
+import tile_types
+from turn_logic import TurnState, take_enemy_turn
+
+from benchmarks.harness import measure
+
+MONSTER_COUNTS = [10, 100, 1000]
+
+ARENA_WIDTH = 120
+ARENA_HEIGHT = 80
+
+
+def build_arena(constants, monsters, seed):
+    player, entities, game_map, message_log, game_state = get_game_variables(constants, run_seed=seed)
+
+    game_map = GameMap(ARENA_WIDTH, ARENA_HEIGHT, run_seed=seed, entity_store=create_store(constants))
+    game_map.set_tiles(slice(1, ARENA_WIDTH - 1), slice(1, ARENA_HEIGHT - 1), tile_types.FLOOR)
+
+    # Everything is in plain sight, so every monster hunts the player instead of dozing off
+    game_map.fov.set(0, 0, np.ones((ARENA_WIDTH, ARENA_HEIGHT), dtype=np.bool_))
+
+    # The player only has to survive the turn
+    player.fighter.hp = player.fighter.base_max_hp = 10 ** 6
+    player.x = ARENA_WIDTH // 2
+    player.y = ARENA_HEIGHT // 2
+    entities = [player]
+    game_map.entity_index.add(player)
+
+    rng = random.Random(seed)
+    cells = [(x, y) for x in range(1, ARENA_WIDTH - 1) for y in range(1, ARENA_HEIGHT - 1)
+             if (x, y) != (player.x, player.y)]
+
+    for x, y in rng.sample(cells, monsters):
+        monster = constants['entity_templates'].spawn('orc', x, y, game_map.entity_store)
+        game_map.add_entity(entities, monster)
+        game_map.wake(monster)
+
+    message_log = MessageLog(constants['message_x'], constants['message_width'], constants['message_height'],
+                             constants['message_capacity'])
+
+    return TurnState(player, entities, game_map, message_log, GameStates.ENEMY_TURN, constants, None)
+
+
+def benchmarks(repeat, seed):
+    constants = get_constants()
+
+    for monsters in MONSTER_COUNTS:
+        yield (f'enemy_turn/{monsters}_monsters',
+               measure(take_enemy_turn, repeat, lambda: (build_arena(constants, monsters, seed),), monsters=monsters))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the enemy turn.')
+    parser.add_argument('--repeat', type=int, default=10, help='runs per measurement')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for name, result in benchmarks(args.repeat, args.seed):
+        print(f"{name}: {result['best'] * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Times one field of view computation with each engine at several radii, without the cache.
+
+    python -m benchmarks.field_of_view --repeat 10
+"""
+
+import argparse
+
+import numpy as np
+
+from fov import get_fov_engine
+from loader_functions.initialize_new_game import get_constants, get_game_variables
+
+from benchmarks.harness import measure
+
+ALGORITHMS = ['BASIC', 'SYMMETRIC_SHADOWCAST']
+RADII = [5, 10, 20]
+
+# Floor tiles the field is computed from on every run
+POSITIONS = 50
+
+
+def benchmarks(repeat, seed):
+    constants = get_constants()
+    player, entities, game_map, message_log, game_state = get_game_variables(constants, run_seed=seed)
+
+    floor = np.argwhere(game_map.transparent.window(0, 0, game_map.width, game_map.height)).tolist()
+    positions = [floor[i] for i in np.linspace(0, len(floor) - 1, POSITIONS).astype(int)]
+
+    for algorithm in ALGORITHMS:
+        engine = get_fov_engine(algorithm)
+
+        for radius in RADII:
+            def compute():
+                for x, y in positions:
+                    engine.compute(game_map, x, y, radius, constants['fov_light_walls'])
+
+            yield (f'fov/{algorithm.lower()}/radius_{radius}',
+                   measure(compute, repeat, number=len(positions), algorithm=algorithm, radius=radius))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time field of view computation.')
+    parser.add_argument('--repeat', type=int, default=10, help='runs per measurement')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for name, result in benchmarks(args.repeat, args.seed):
+        print(f"{name}: {result['best'] * 1e6:.1f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Timing and machine metadata shared by the benchmarks.
+"""
+
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+
+def measure(function, repeat, setup=None, number=1, **params):
+    '''
+    Times function over repeat runs. setup runs before each one, outside the timing, and whatever it returns is
+    passed to function. Each run does number operations, the times are reported per operation.
+    '''
+    times = []
+
+    for i in range(repeat):
+        args = setup() if setup else ()
+
+        start = time.perf_counter()
+        function(*args)
+        times.append((time.perf_counter() - start) / number)
+
+    return {
+        'best': min(times),
+        'median': statistics.median(times),
+        'repeat': repeat,
+        'params': params
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def machine_metadata():
+    metadata = {
+        'time': datetime.now(timezone.utc).isoformat(),
+        'commit': git_commit(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__
+    }
+
+    try:
+        import tcod
+        metadata['tcod'] = tcod.__version__
+    except ImportError:
+        metadata['tcod'] = None
+
+    return metadata
@@ -0,0 +1,67 @@
+"""
+Times make_map at several map sizes and room counts, and both generators on one large floor.
+
+    python -m benchmarks.mapgen --repeat 10
+"""
+
+import argparse
+
+from entity_store import create_store
+from loader_functions.initialize_new_game import get_constants, get_game_variables
+from map_utils import GameMap, make_map
+
+from benchmarks.harness import measure
+
+# (width, height) of the maps generated, the first is the game's own
+MAP_SIZES = [(80, 43), (160, 86), (320, 172)]
+ROOM_COUNTS = [30, 100, 300]
+
+# (width, height, max_rooms) of a floor big enough for every generator to fit its rooms
+LARGE_FLOOR = (400, 400, 1000)
+GENERATORS = ['ROOMS', 'BSP']
+
+
+def benchmarks(repeat, seed):
+    constants = get_constants()
+    templates = constants['entity_templates']
+    player = get_game_variables(constants, run_seed=seed)[0]
+
+    for width, height in MAP_SIZES:
+        for max_rooms in ROOM_COUNTS:
+            def setup():
+                return (GameMap(width, height, run_seed=seed, entity_store=create_store(constants)),)
+
+            def generate(game_map):
+                make_map(game_map, max_rooms, constants['room_min_size'], constants['room_max_size'], width, height,
+                         player, [player], templates)
+
+            yield (f'mapgen/{width}x{height}/{max_rooms}_rooms',
+                   measure(generate, repeat, setup, width=width, height=height, max_rooms=max_rooms))
+
+    width, height, max_rooms = LARGE_FLOOR
+
+    for generator in GENERATORS:
+        def setup():
+            return (GameMap(width, height, run_seed=seed, entity_store=create_store(constants)),)
+
+        def generate(game_map):
+            make_map(game_map, max_rooms, constants['room_min_size'], constants['room_max_size'], width, height,
+                     player, [player], templates, generator)
+
+        yield (f'mapgen/{generator.lower()}/{width}x{height}/{max_rooms}_rooms',
+               measure(generate, repeat, setup, width=width, height=height, max_rooms=max_rooms,
+                       generator=generator))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time map generation.')
+    parser.add_argument('--repeat', type=int, default=10, help='runs per measurement')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for name, result in benchmarks(args.repeat, args.seed):
+        print(f"{name}: {result['best'] * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Times drawing a full frame with render_all onto off-screen consoles, as after a new floor or a load.
+
+    python -m benchmarks.render --repeat 20
+"""
+
+import argparse
+
+import tdl
+
+from game_states import GameStates
+from loader_functions.initialize_new_game import get_constants, get_game_variables
+from render_functions import RenderState, render_all
+from turn_logic import TurnState, update_fov
+
+from benchmarks.harness import measure
+
+
+def benchmarks(repeat, seed):
+    constants = get_constants()
+    player, entities, game_map, message_log, game_state = get_game_variables(constants, run_seed=seed)
+
+    update_fov(TurnState(player, entities, game_map, message_log, game_state, constants, None))
+
+    # Nothing is shown, the frame is drawn to consoles that are never flushed
+    root_console = tdl.Console(constants['screen_width'], constants['screen_height'])
+    con = tdl.Console(constants['screen_width'], constants['screen_height'])
+    panel = tdl.Console(constants['screen_width'], constants['panel_height'])
+
+    def render(render_state):
+        render_all(con, panel, entities, player, game_map, True, root_console, message_log,
+                   constants['screen_width'], constants['screen_height'], constants['bar_width'],
+                   constants['panel_height'], constants['panel_y'], (0, 0), constants['colors'],
+                   GameStates.PLAYERS_TURN, render_state)
+
+    yield ('render/full_frame', measure(render, repeat, lambda: (RenderState(),),
+                                        width=constants['screen_width'], height=constants['screen_height']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time drawing a full frame.')
+    parser.add_argument('--repeat', type=int, default=20, help='runs per measurement')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for name, result in benchmarks(args.repeat, args.seed):
+        print(f"{name}: {result['best'] * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Times saving and loading a game in the binary save format against the old shelve format.
+
+    python -m benchmarks.save_load --repeat 20
+"""
+
+import argparse
+import os
+import shelve
+import tempfile
+import time
+
+from loader_functions.initialize_new_game import get_constants, get_game_variables
+from loader_functions.save_format import read_snapshot, restore_game, snapshot_game, write_snapshot
+
+from benchmarks.harness import measure
+
+
+def time_call(function, repeat):
+    best = None
+
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def shelve_size(path):
+    return sum(os.path.getsize(path + suffix) for suffix in ('.dat', '.dir', '.bak') if os.path.isfile(path + suffix))
+
+
+def run(repeat, seed):
+    constants = get_constants()
+    player, entities, game_map, message_log, game_state = get_game_variables(constants, run_seed=seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        save_path = os.path.join(directory, 'savegame.sav')
+        shelve_path = os.path.join(directory, 'savegame')
+
+        def save_binary():
+            write_snapshot(snapshot_game(player, entities, game_map, message_log, game_state), save_path)
+
+        def load_binary():
+            restore_game(read_snapshot(save_path))
+
+        def save_shelve():
+            with shelve.open(shelve_path, 'n') as data_file:
+                data_file['player_index'] = entities.index(player)
+                data_file['entities'] = entities
+                data_file['game_map'] = game_map
+                data_file['message_log'] = message_log
+                data_file['game_state'] = game_state
+
+        def load_shelve():
+            with shelve.open(shelve_path, 'r') as data_file:
+                for key in ('player_index', 'entities', 'game_map', 'message_log', 'game_state'):
+                    data_file[key]
+
+        results = {
+            'binary': {
+                'save_seconds': time_call(save_binary, repeat),
+                'load_seconds': time_call(load_binary, repeat),
+                'bytes': os.path.getsize(save_path)
+            },
+            'shelve': {
+                'save_seconds': time_call(save_shelve, repeat),
+                'load_seconds': time_call(load_shelve, repeat),
+                'bytes': shelve_size(shelve_path)
+            }
+        }
+
+    return results
+
+
+def benchmarks(repeat, seed):
+    # The binary format only, for the suite
+    constants = get_constants()
+    player, entities, game_map, message_log, game_state = get_game_variables(constants, run_seed=seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        save_path = os.path.join(directory, 'savegame.sav')
+
+        def save():
+            write_snapshot(snapshot_game(player, entities, game_map, message_log, game_state), save_path)
+
+        def load():
+            restore_game(read_snapshot(save_path))
+
+        yield 'save_load/save', measure(save, repeat)
+        yield 'save_load/load', measure(load, repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time save/load round trips.')
+    parser.add_argument('--repeat', type=int, default=20, help='runs per measurement, the best one is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for name, result in run(args.repeat, args.seed).items():
+        print(f"{name:>6}: save {result['save_seconds'] * 1000:.2f} ms, load {result['load_seconds'] * 1000:.2f} ms, "
+              f"{result['bytes']} bytes")
+
+
+if __name__ == '__main__':
+    main()
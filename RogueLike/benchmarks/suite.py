@@ -0,0 +1,107 @@
+"""
+Runs every benchmark headless and writes the results as JSON, or compares two such files and flags the
+benchmarks that got slower.
+
+    python -m benchmarks.suite run --output results.json
+    python -m benchmarks.suite compare baseline.json results.json --threshold 0.2
+"""
+
+import argparse
+import json
+import sys
+
+from benchmarks import enemy_turn, field_of_view, mapgen, render, save_load
+from benchmarks.harness import machine_metadata
+
+SUITES = {
+    'mapgen': mapgen,
+    'fov': field_of_view,
+    'enemy_turn': enemy_turn,
+    'save_load': save_load,
+    'render': render
+}
+
+# A benchmark more than this much slower than the baseline is a regression
+DEFAULT_THRESHOLD = 0.2
+
+
+def run(names, repeat, seed):
+    results = {}
+
+    for name in names:
+        for benchmark, result in SUITES[name].benchmarks(repeat, seed):
+            print(f"{benchmark:<40}{result['best'] * 1000:>12.3f} ms", file=sys.stderr)
+            results[benchmark] = result
+
+    return {'metadata': {**machine_metadata(), 'repeat': repeat, 'seed': seed}, 'results': results}
+
+
+def compare(baseline, current, threshold):
+    # Returns the names of the benchmarks that regressed, after printing every one both runs have
+    regressions = []
+
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+
+        before = baseline['results'][name]['best']
+        after = result['best']
+        ratio = after / before if before else float('inf')
+
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            verdict = 'REGRESSION'
+        elif ratio < 1 - threshold:
+            verdict = 'faster'
+        else:
+            verdict = ''
+
+        print(f'{name:<40}{before * 1000:>12.3f} ms{after * 1000:>12.3f} ms{ratio:>8.2f}x  {verdict}')
+
+    for key in ('platform', 'processor', 'python'):
+        if baseline['metadata'].get(key) != current['metadata'].get(key):
+            print(f"Warning: {key} differs from the baseline ({baseline['metadata'].get(key)} against "
+                  f"{current['metadata'].get(key)})")
+
+    return regressions
+
+
+def load_results(path):
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the benchmarks or compare their results.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmarks and write their results')
+    run_parser.add_argument('--output', default='benchmark_results.json')
+    run_parser.add_argument('--only', nargs='+', choices=sorted(SUITES), default=list(SUITES),
+                            help='run only these benchmarks')
+    run_parser.add_argument('--repeat', type=int, default=10, help='runs per measurement')
+    run_parser.add_argument('--seed', type=int, default=0)
+
+    compare_parser = commands.add_parser('compare', help='flag benchmarks slower than the baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                                help='how much slower counts as a regression, 0.2 is 20%%')
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        results = run(args.only, args.repeat, args.seed)
+
+        with open(args.output, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
+    else:
+        regressions = compare(load_results(args.baseline), load_results(args.current), args.threshold)
+
+        if regressions:
+            print(f'{len(regressions)} regression(s)')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
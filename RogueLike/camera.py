@@ -0,0 +1,35 @@
+class Camera:
+    '''
+    The part of the map shown on screen: width x height cells with its top left corner at (x, y) on the map. It
+    keeps the player in the middle, and stops at the map's edges.
+    '''
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.x = 0
+        self.y = 0
+
+    @property
+    def bounds(self):
+        # (x1, y1, x2, y2) of the shown part of the map
+        return self.x, self.y, self.x + self.width, self.y + self.height
+
+    def follow(self, target_x, target_y, map_width, map_height):
+        # Returns whether the camera moved
+        x = min(max(target_x - self.width // 2, 0), max(map_width - self.width, 0))
+        y = min(max(target_y - self.height // 2, 0), max(map_height - self.height, 0))
+
+        moved = (x, y) != (self.x, self.y)
+        self.x, self.y = x, y
+
+        return moved
+
+    def to_map(self, x, y):
+        return x + self.x, y + self.y
+
+    def to_screen(self, x, y):
+        return x - self.x, y - self.y
+
+    def shows(self, x, y):
+        # Whether the map cell (x, y) is on screen
+        return self.x <= x < self.x + self.width and self.y <= y < self.y + self.height
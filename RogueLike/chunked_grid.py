@@ -0,0 +1,198 @@
+import numpy as np
+
+# Chunks are CHUNK_SIZE x CHUNK_SIZE cells, a power of two so a coordinate splits into chunk and offset with shifts
+CHUNK_SHIFT = 5
+CHUNK_SIZE = 1 << CHUNK_SHIFT
+CHUNK_MASK = CHUNK_SIZE - 1
+
+
+def is_index(value):
+    return isinstance(value, (int, np.integer))
+
+
+class ChunkedGrid:
+    '''
+    A width x height grid indexed as grid[x, y], stored as square chunks that only exist once something other than
+    the fill value is written to them. Memory grows with what is drawn on the grid, not with its size.
+    '''
+    def __init__(self, width, height, dtype, fill):
+        self.width = width
+        self.height = height
+        self.dtype = np.dtype(dtype)
+        self.fill = self.dtype.type(fill)
+
+        # (chunk x, chunk y) -> the chunk as stored, a CHUNK_SIZE x CHUNK_SIZE array unless a subclass packs it
+        self.chunks = {}
+        self.chunk_shape = (CHUNK_SIZE, CHUNK_SIZE)
+        self.chunk_dtype = self.dtype
+
+    @property
+    def shape(self):
+        return self.width, self.height
+
+    @property
+    def nbytes(self):
+        return sum(chunk.nbytes for chunk in self.chunks.values())
+
+    def __getitem__(self, position):
+        x, y = position
+
+        if is_index(x) and is_index(y):
+            chunk = self.chunk((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+
+            return self.fill if chunk is None else chunk[x & CHUNK_MASK, y & CHUNK_MASK]
+
+        if isinstance(x, slice) or isinstance(y, slice):
+            x1, x2 = self.span(x, self.width)
+            y1, y2 = self.span(y, self.height)
+            area = self.window(x1, y1, x2, y2)
+
+            # A single index on one axis drops that axis, like numpy does
+            return area[0 if is_index(x) else slice(None), 0 if is_index(y) else slice(None)]
+
+        return self.gather(np.asarray(x), np.asarray(y))
+
+    def __setitem__(self, position, value):
+        x, y = position
+        x1, x2 = self.span(x, self.width)
+        y1, y2 = self.span(y, self.height)
+
+        self.write(x1, y1, np.broadcast_to(np.asarray(value, dtype=self.dtype), (x2 - x1, y2 - y1)))
+
+    @staticmethod
+    def span(index, size):
+        # (start, stop) of an int or a step-less slice along an axis of the given size
+        if is_index(index):
+            return index, index + 1
+
+        start, stop, step = index.indices(size)
+
+        if step != 1:
+            raise IndexError('ChunkedGrid slices cannot have a step')
+
+        return start, max(stop, start)
+
+    def gather(self, xs, ys):
+        # grid[xs, ys] for integer arrays, one lookup per chunk the coordinates fall in
+        values = np.full(xs.shape, self.fill, dtype=self.dtype)
+        chunk_xs = xs >> CHUNK_SHIFT
+        chunk_ys = ys >> CHUNK_SHIFT
+
+        for key in set(zip(chunk_xs.ravel().tolist(), chunk_ys.ravel().tolist())):
+            chunk = self.chunk(key)
+
+            if chunk is not None:
+                selected = (chunk_xs == key[0]) & (chunk_ys == key[1])
+                values[selected] = chunk[xs[selected] & CHUNK_MASK, ys[selected] & CHUNK_MASK]
+
+        return values
+
+    def overlapping(self, x1, y1, x2, y2):
+        # For every chunk position the area [x1, x2) x [y1, y2) touches: the key and the overlap, as slices into
+        # the chunk and into the area
+        for chunk_x in range(x1 >> CHUNK_SHIFT, ((x2 - 1) >> CHUNK_SHIFT) + 1):
+            left = max(x1, chunk_x << CHUNK_SHIFT)
+            right = min(x2, (chunk_x + 1) << CHUNK_SHIFT)
+
+            for chunk_y in range(y1 >> CHUNK_SHIFT, ((y2 - 1) >> CHUNK_SHIFT) + 1):
+                top = max(y1, chunk_y << CHUNK_SHIFT)
+                bottom = min(y2, (chunk_y + 1) << CHUNK_SHIFT)
+
+                yield ((chunk_x, chunk_y),
+                       (slice(left & CHUNK_MASK, ((right - 1) & CHUNK_MASK) + 1),
+                        slice(top & CHUNK_MASK, ((bottom - 1) & CHUNK_MASK) + 1)),
+                       (slice(left - x1, right - x1), slice(top - y1, bottom - y1)))
+
+    def window(self, x1, y1, x2, y2):
+        # A dense copy of [x1, x2) x [y1, y2). It may reach past the grid's edges, everything there is fill.
+        area = np.full((x2 - x1, y2 - y1), self.fill, dtype=self.dtype)
+
+        if x2 <= x1 or y2 <= y1:
+            return area
+
+        for key, in_chunk, in_area in self.overlapping(x1, y1, x2, y2):
+            chunk = self.chunk(key)
+
+            if chunk is not None:
+                area[in_area] = chunk[in_chunk]
+
+        return area
+
+    def write(self, x1, y1, values):
+        # Copy a dense array into the grid with its corner at (x1, y1), whatever falls off the grid is dropped
+        x2 = x1 + values.shape[0]
+        y2 = y1 + values.shape[1]
+
+        left, top = max(x1, 0), max(y1, 0)
+        right, bottom = min(x2, self.width), min(y2, self.height)
+
+        if right <= left or bottom <= top:
+            return
+
+        values = values[left - x1:right - x1, top - y1:bottom - y1]
+
+        for key, in_chunk, in_area in self.overlapping(left, top, right, bottom):
+            chunk = self.chunk(key)
+            part = values[in_area]
+
+            if chunk is None:
+                if not (part != self.fill).any():
+                    continue
+
+                chunk = np.full((CHUNK_SIZE, CHUNK_SIZE), self.fill, dtype=self.dtype)
+
+            chunk[in_chunk] = part
+            self.store(key, chunk)
+
+    def chunk(self, key):
+        # The chunk at key as a CHUNK_SIZE x CHUNK_SIZE array, or None if it was never allocated
+        return self.chunks.get(key)
+
+    def store(self, key, chunk):
+        self.chunks[key] = chunk
+
+    def update(self, x1, y1, mask):
+        # Set every cell that is True in a boolean array with its corner at (x1, y1)
+        self.write(x1, y1, self.window(x1, y1, x1 + mask.shape[0], y1 + mask.shape[1]) | mask)
+
+    def to_array(self):
+        return self.window(0, 0, self.width, self.height)
+
+    @classmethod
+    def from_array(cls, values, fill):
+        grid = cls(values.shape[0], values.shape[1], values.dtype, fill)
+        grid.write(0, 0, values)
+
+        return grid
+
+    def to_chunks(self):
+        # The chunk keys as an (n, 2) array and the chunks as stored stacked into one array, for saving
+        keys = sorted(self.chunks)
+
+        return (np.array(keys, dtype=np.int32).reshape(-1, 2),
+                np.array([self.chunks[key] for key in keys], dtype=self.chunk_dtype).reshape(-1, *self.chunk_shape))
+
+    @classmethod
+    def from_chunks(cls, width, height, dtype, fill, keys, chunks):
+        grid = cls(width, height, dtype, fill)
+        grid.chunks = {(chunk_x, chunk_y): chunk.copy() for (chunk_x, chunk_y), chunk in zip(keys.tolist(), chunks)}
+
+        return grid
+
+
+class PackedChunkedGrid(ChunkedGrid):
+    '''
+    A ChunkedGrid of booleans whose chunks are stored eight cells to a byte, a chunk takes 128 bytes.
+    '''
+    def __init__(self, width, height, dtype=np.bool_, fill=False):
+        super().__init__(width, height, np.bool_, fill)
+        self.chunk_shape = (CHUNK_SIZE, CHUNK_SIZE // 8)
+        self.chunk_dtype = np.dtype(np.uint8)
+
+    def chunk(self, key):
+        bits = self.chunks.get(key)
+
+        return None if bits is None else np.unpackbits(bits, axis=1).astype(np.bool_)
+
+    def store(self, key, chunk):
+        self.chunks[key] = np.packbits(chunk, axis=1)
@@ -1,32 +1,57 @@
-from random import randint
+from components.component import Component
 from game_messages import Message
 
-class BasicMonster:
+class BasicMonster(Component):
+    __slots__ = ('awake', 'patience', 'turns_unseen')
+
+    def __init__(self, patience=10):
+        super().__init__()
+        # Asleep monsters are skipped by the enemy turn until something wakes them
+        self.awake = False
+        self.patience = patience
+        self.turns_unseen = 0
+
     def take_turn(self, target, game_map, entities):
         results = []
         monster = self.owner
 
         if game_map.fov[monster.x, monster.y]:
+            self.turns_unseen = 0
+
             if monster.distance_to(target) >= 2:
-                monster.move_towards(target.x, target.y, game_map, entities)
+                monster.move_along(game_map.flow_field_to(target.x, target.y), game_map)
 
             elif target.fighter.hp >= 0:
                 attack_results = monster.fighter.attack(target)
                 results.extend(attack_results)
 
+        else:
+            # Out of sight, keep hunting for a while and then doze off again
+            self.turns_unseen += 1
+
+            if self.turns_unseen > self.patience:
+                self.awake = False
+                self.turns_unseen = 0
+            else:
+                monster.move_along(game_map.flow_field_to(target.x, target.y), game_map)
+
         return results
 
-class ConfusedMonster:
+class ConfusedMonster(Component):
+    __slots__ = ('previous_ai', 'number_of_turns', 'awake')
+
     def __init__(self, previous_ai, number_of_turns=10):
+        super().__init__()
         self.previous_ai = previous_ai
         self.number_of_turns = number_of_turns
+        self.awake = True
 
     def take_turn(self, target, game_map, entities):
         results = []
 
         if self.number_of_turns > 0:
-            random_x = self.owner.x + randint(0, 2) - 1
-            random_y = self.owner.y + randint(0, 2) - 1
+            random_x = self.owner.x + game_map.ai_random.randint(0, 2) - 1
+            random_y = self.owner.y + game_map.ai_random.randint(0, 2) - 1
 
             if random_x != self.owner.x and random_y != self.owner.y:
                 self.owner.move_towards(random_x, random_y, game_map, entities)
@@ -34,6 +59,7 @@ class ConfusedMonster:
             self.number_of_turns -= 1
         else:
             self.owner.ai = self.previous_ai
+            self.previous_ai.awake = True
             results.append({'message': Message('The {0} is no longer confused!'.format(self.owner.name))})
 
         return results
@@ -0,0 +1,21 @@
+class Component:
+    '''
+    Base of the component classes. Their state lives in __slots__ rather than a per-instance dict.
+    '''
+    __slots__ = ('owner',)
+
+    def __init__(self):
+        self.owner = None
+
+    def __setstate__(self, state):
+        restore_slots(self, state)
+
+
+def restore_slots(obj, state):
+    # Objects pickled before their class had __slots__ carry a plain attribute dict instead of (dict, slots)
+    if isinstance(state, tuple):
+        dict_state, slot_state = state
+        state = {**(dict_state or {}), **(slot_state or {})}
+
+    for name, value in state.items():
+        setattr(obj, name, value)
@@ -1,68 +1,65 @@
+from components.component import Component
 from equipment_slots import EquipmentSlots
 
-class Equipment:
-    def __init__(self, main_hand=None, off_hand=None):
-        self.main_hand = main_hand
-        self.off_hand = off_hand
+class Equipment(Component):
+    '''
+    One equipped entity (or None) per EquipmentSlots member. The bonuses are summed when the equipment changes,
+    so reading them is an attribute load.
+    '''
+    __slots__ = ('slots', 'max_hp_bonus', 'power_bonus', 'defense_bonus')
 
-    @property
-    def max_hp_bonus(self):
-        bonus = 0
+    def __init__(self, equipped=()):
+        super().__init__()
+        self.slots = {slot: None for slot in EquipmentSlots}
 
-        if self.main_hand and self.main_hand.equippable:
-            bonus += self.main_hand.equippable.max_hp_bonus
+        for equippable_entity in equipped:
+            self.slots[equippable_entity.equippable.slot] = equippable_entity
 
-        if self.off_hand and self.off_hand.equippable:
-            bonus += self.off_hand.equippable.max_hp_bonus
+        self.update_bonuses()
 
-        return bonus
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # Pickled when there were only a main_hand and an off_hand attribute. The bonuses are summed by the
+            # loader once every entity is unpickled.
+            self.owner = state.get('owner')
+            self.slots = {slot: None for slot in EquipmentSlots}
+            self.slots[EquipmentSlots.MAIN_HAND] = state.get('main_hand')
+            self.slots[EquipmentSlots.OFF_HAND] = state.get('off_hand')
+        else:
+            super().__setstate__(state)
 
-    @property
-    def power_bonus(self):
-        bonus = 0
+    def slot_of(self, entity):
+        for slot, equipped in self.slots.items():
+            if equipped == entity:
+                return slot
 
-        if self.main_hand and self.main_hand.equippable:
-            bonus += self.main_hand.equippable.power_bonus
+        return None
 
-        if self.off_hand and self.off_hand.equippable:
-            bonus += self.off_hand.equippable.power_bonus
+    def update_bonuses(self):
+        equippables = [equipped.equippable for equipped in self.slots.values() if equipped]
 
-        return bonus
+        self.max_hp_bonus = sum(equippable.max_hp_bonus for equippable in equippables)
+        self.power_bonus = sum(equippable.power_bonus for equippable in equippables)
+        self.defense_bonus = sum(equippable.defense_bonus for equippable in equippables)
 
-    @property
-    def defense_bonus(self):
-        bonus = 0
-
-        if self.main_hand and self.main_hand.equippable:
-            bonus += self.main_hand.equippable.defense_bonus
-
-        if self.off_hand and self.off_hand.equippable:
-            bonus += self.off_hand.equippable.defense_bonus
-
-        return bonus
+        if self.owner and self.owner.fighter:
+            self.owner.fighter.update_stats()
 
     def toggle_equip(self, equippable_entity):
         results=[]
 
         slot = equippable_entity.equippable.slot
-
-        if slot == EquipmentSlots.MAIN_HAND:
-            if self.main_hand == equippable_entity:
-                self.main_hand = None
-                results.append({'dequipped': equippable_entity})
-            else:
-                if self.main_hand:
-                    results.append({'dequipped': equippable_entity})
-                self.main_hand = equippable_entity
-                results.append({'equipped': self.main_hand})
-        elif slot == EquipmentSlots.MAIN_HAND:
-            if self.main_hand == equippable_entity:
-                self.main_hand = None
-                results.append({'dequipped': equippable_entity})
-            else:
-                if self.main_hand:
-                    results.append({'dequipped': equippable_entity})
-                self.main_hand = equippable_entity
-                results.append({'equipped': self.main_hand})
+        current = self.slots[slot]
+
+        if current == equippable_entity:
+            self.slots[slot] = None
+            results.append({'dequipped': equippable_entity})
+        else:
+            if current:
+                results.append({'dequipped': current})
+            self.slots[slot] = equippable_entity
+            results.append({'equipped': equippable_entity})
+
+        self.update_bonuses()
 
         return results
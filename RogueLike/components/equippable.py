@@ -1,5 +1,10 @@
-class Equippable:
+from components.component import Component
+
+class Equippable(Component):
+    __slots__ = ('slot', 'power_bonus', 'defense_bonus', 'max_hp_bonus')
+
     def __init__(self, slot, power_bonus=0, defense_bonus=0, max_hp_bonus=0):
+        super().__init__()
         self.slot=slot
         self.power_bonus = power_bonus
         self.defense_bonus = defense_bonus
@@ -1,45 +1,41 @@
+from components.component import Component
 from game_messages import Message
 
-class Fighter:
+class Fighter(Component):
+    # max_hp, power and defense are the totals with equipment, kept up to date by update_stats
+    __slots__ = ('base_max_hp', 'hp', 'base_defense', 'base_power', 'xp', 'max_hp', 'power', 'defense')
+
     def __init__(self, hp, defense, power, xp=0):
+        super().__init__()
         self.base_max_hp = hp
         self.hp = hp
         self.base_defense = defense
         self.base_power = power
         self.xp = xp
 
-    @property
-    def max_hp(self):
-        if self.owner and self.owner.equipment:
-            bonus = self.owner.equipment.max_hp_bonus
-        else:
-            bonus = 0
+        self.update_stats()
 
-        return self.base_max_hp + bonus
+    def update_stats(self):
+        # Call after changing a base stat or the owner's equipment, combat only reads the cached totals
+        equipment = self.owner.equipment if self.owner else None
 
-    @property
-    def power(self):
-        if self.owner and self.owner.equipment:
-            bonus = self.owner.equipment.power_bonus
+        if equipment:
+            self.max_hp = self.base_max_hp + equipment.max_hp_bonus
+            self.power = self.base_power + equipment.power_bonus
+            self.defense = self.base_defense + equipment.defense_bonus
         else:
-            bonus = 0
-
-        return self.base_power + bonus
-
-    @property
-    def defense(self):
-        if self.owner and self.owner.equipment:
-            bonus = self.owner.equipment.defense_bonus
-        else:
-            bonus = 0
-
-        return self.base_defense + bonus
+            self.max_hp = self.base_max_hp
+            self.power = self.base_power
+            self.defense = self.base_defense
 
     def take_damage(self, amount):
         results = []
 
         self.hp -= amount
 
+        if self.owner.ai:
+            results.append({'wake': self.owner})
+
         if self.hp <= 0:
             results.append({'dead': self.owner, 'xp': self.xp})
 
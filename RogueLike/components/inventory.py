@@ -1,7 +1,11 @@
+from components.component import Component
 from game_messages import Message
 
-class Inventory:
+class Inventory(Component):
+    __slots__ = ('capacity', 'items')
+
     def __init__(self, capacity):
+        super().__init__()
         self.capacity = capacity
         self.items = []
 
@@ -55,7 +59,7 @@ class Inventory:
     def drop_item(self, item, colors):
         results = []
 
-        if self.owner.equipment.main_hand == item or self.owner.equipment.off_hand == item:
+        if self.owner.equipment.slot_of(item):
             self.owner.equipment.toggle_equip(item)
 
         item.x = self.owner.x
@@ -1,5 +1,10 @@
-class Item:
+from components.component import Component
+
+class Item(Component):
+    __slots__ = ('use_function', 'targeting', 'targeting_message', 'function_kwargs')
+
     def __init__(self, use_function=None, targeting=False, targeting_message=None, **kwargs):
+        super().__init__()
         self.use_function = use_function
         self.targeting = targeting
         self.targeting_message = targeting_message
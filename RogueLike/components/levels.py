@@ -1,5 +1,10 @@
-class Level:
+from components.component import Component
+
+class Level(Component):
+    __slots__ = ('current_level', 'current_xp', 'level_up_base', 'level_up_factor')
+
     def __init__(self, current_level=1, current_xp=0, level_up_base=200, level_up_factor=150):
+        super().__init__()
         self.current_level= current_level
         self.current_xp = current_xp
         self.level_up_base = level_up_base
@@ -1,3 +1,8 @@
-class Stairs:
+from components.component import Component
+
+class Stairs(Component):
+    __slots__ = ('floor',)
+
     def __init__(self, floor):
+        super().__init__()
         self.floor = floor
@@ -0,0 +1,228 @@
+import os
+import shutil
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from entity import Entity
+from entity_store import create_store
+from loader_functions.save_format import (decode_snapshot, encode_snapshot, read_snapshot, restore_floor,
+                                          snapshot_floor, write_snapshot)
+from map_utils import GameMap, make_map, next_floor, rest
+from render_functions import RenderOrder
+
+
+class Dungeon:
+    '''
+    Every floor visited so far. The few most recently left ones stay in memory, older ones are written to
+    compressed files and read back when the player returns, so memory doesn't grow with the depth of the run.
+    Each run keeps its files in a directory of its own, named after its seed.
+    '''
+    def __init__(self, directory, cache_size, pregenerator=None):
+        self.directory = directory
+        self.cache_size = cache_size
+        self.pregenerator = pregenerator
+
+        # dungeon level -> (game map, entities), least recently used first
+        self.floors = OrderedDict()
+
+        # Levels in self.floors that changed since their file was last written
+        self.unsaved = set()
+
+        self.run_seed = None
+
+    def floor_path(self, dungeon_level):
+        return os.path.join(self.directory, f'run_{self.run_seed}', f'floor_{dungeon_level}.sav')
+
+    def start(self, run_seed, new_game=False):
+        # Called when a game is started or loaded, whatever floors are in memory belong to the game played before
+        self.floors.clear()
+        self.unsaved.clear()
+        self.run_seed = run_seed
+
+        if self.pregenerator:
+            self.pregenerator.clear()
+
+        if new_game and os.path.isdir(self.directory):
+            # There is only one save, so once a new game starts no other run's floors can be loaded again
+            for file_name in os.listdir(self.directory):
+                path = os.path.join(self.directory, file_name)
+
+                if file_name.startswith('run_'):
+                    shutil.rmtree(path)
+                elif file_name.startswith('floor_'):
+                    # Left by versions that kept every run's floors in one place
+                    os.remove(path)
+
+    def store(self, game_map, entities):
+        self.floors[game_map.dungeon_level] = (game_map, entities)
+        self.floors.move_to_end(game_map.dungeon_level)
+        self.unsaved.add(game_map.dungeon_level)
+
+        while len(self.floors) > self.cache_size:
+            dungeon_level, (evicted_map, evicted_entities) = self.floors.popitem(last=False)
+
+            if dungeon_level in self.unsaved:
+                self.write_floor(evicted_map, evicted_entities)
+
+    def take(self, dungeon_level):
+        # Returns (game map, entities) of a floor visited before, or None if it was never generated
+        floor = self.floors.pop(dungeon_level, None)
+
+        if floor:
+            # It becomes the current floor, which is written with the game itself
+            self.unsaved.discard(dungeon_level)
+
+            return floor
+
+        path = self.floor_path(dungeon_level)
+
+        if os.path.isfile(path):
+            # The file is kept, it is what the last save expects this floor to be until it is written again
+            game_map, entities = restore_floor(read_snapshot(path))
+
+            if game_map.streams.run_seed == self.run_seed:
+                return game_map, entities
+
+        return None
+
+    def write_floor(self, game_map, entities):
+        write_floor_snapshot(snapshot_floor(game_map, entities), self.floor_path(game_map.dungeon_level))
+        self.unsaved.discard(game_map.dungeon_level)
+
+    def unsaved_floors(self):
+        # (snapshot, path) of every floor in memory that changed since it was last written, for the autosave to
+        # write along with the game. They count as written from here on.
+        floors = [(snapshot_floor(*self.floors[dungeon_level]), self.floor_path(dungeon_level))
+                  for dungeon_level in self.unsaved if dungeon_level in self.floors]
+        self.unsaved.clear()
+
+        return floors
+
+    def flush(self):
+        # Write every floor that changed since it was last written, needed before the game is saved
+        for dungeon_level in list(self.unsaved):
+            if dungeon_level in self.floors:
+                self.write_floor(*self.floors[dungeon_level])
+
+        self.unsaved.clear()
+
+    def is_generated(self, dungeon_level):
+        return dungeon_level in self.floors or os.path.isfile(self.floor_path(dungeon_level))
+
+    def pregenerate_below(self, game_map):
+        # Start building the floor under this one in the background, unless it already exists
+        if self.pregenerator and not self.is_generated(game_map.dungeon_level + 1):
+            self.pregenerator.request(game_map.dungeon_level + 1, game_map.streams.run_seed)
+
+    def change_floor(self, player, entities, game_map, message_log, dungeon_level, constants):
+        previous_level = game_map.dungeon_level
+        run_seed = game_map.streams.run_seed
+
+        game_map.remove_entity(entities, player)
+        self.store(game_map, entities)
+
+        floor = self.take(dungeon_level)
+
+        if not floor:
+            game_map, entities = self.new_floor(player, message_log, dungeon_level, constants, run_seed)
+            self.pregenerate_below(game_map)
+
+            return game_map, entities
+
+        game_map, entities = floor
+
+        # Arrive on the stairs that lead back to the floor just left
+        for entity in entities:
+            if entity.stairs and entity.stairs.floor == previous_level:
+                player.x = entity.x
+                player.y = entity.y
+                break
+
+        game_map.add_entity(entities, player)
+        self.pregenerate_below(game_map)
+
+        return game_map, entities
+
+    def new_floor(self, player, message_log, dungeon_level, constants, run_seed):
+        floor = self.pregenerator.take(dungeon_level, run_seed) if self.pregenerator else None
+
+        if not floor:
+            # Not asked for or not finished yet, build it now. It comes out the same as the worker's would have.
+            return next_floor(player, message_log, dungeon_level, constants, run_seed)
+
+        game_map, entities, (player.x, player.y) = floor
+        game_map.add_entity(entities, player)
+
+        rest(player, message_log, constants)
+
+        return game_map, entities
+
+
+def write_floor_snapshot(snapshot, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_snapshot(snapshot, path)
+
+
+def generate_floor(dungeon_level, constants, run_seed):
+    '''
+    Runs in a worker process. Builds a floor and returns it encoded in the save format, along with where the
+    player starts on it.
+    '''
+    placeholder = Entity(0, 0, '@', (255, 255, 255), 'Player', blocks=True, render_order=RenderOrder.ACTOR)
+    game_map = GameMap(constants['map_width'], constants['map_height'], dungeon_level, run_seed,
+                       create_store(constants))
+    entities = [placeholder]
+
+    make_map(game_map, constants['max_rooms'], constants['room_min_size'],
+             constants['room_max_size'], constants['map_width'], constants['map_height'], placeholder, entities,
+             constants['entity_templates'], constants['map_generator'])
+
+    game_map.remove_entity(entities, placeholder)
+
+    return encode_snapshot(snapshot_floor(game_map, entities)), (placeholder.x, placeholder.y)
+
+
+class FloorPregenerator:
+    '''
+    Generates floors ahead of time in a worker process, so taking the stairs doesn't have to wait for make_map.
+    '''
+    def __init__(self, constants):
+        self.constants = constants
+        self.executor = ProcessPoolExecutor(max_workers=1)
+
+        # (run seed, dungeon level) -> future of generate_floor
+        self.futures = {}
+
+    def request(self, dungeon_level, run_seed):
+        if (run_seed, dungeon_level) not in self.futures:
+            self.futures[(run_seed, dungeon_level)] = self.executor.submit(generate_floor, dungeon_level,
+                                                                           self.constants, run_seed)
+
+    def take(self, dungeon_level, run_seed):
+        # Returns (game map, entities, player start) if the floor is ready, None if it isn't
+        future = self.futures.pop((run_seed, dungeon_level), None)
+
+        if not future or not future.done():
+            if future:
+                future.cancel()
+
+            return None
+
+        if future.exception():
+            return None
+
+        data, player_start = future.result()
+        game_map, entities = restore_floor(decode_snapshot(data))
+
+        return game_map, entities, player_start
+
+    def clear(self):
+        for future in self.futures.values():
+            future.cancel()
+
+        self.futures.clear()
+
+    def shutdown(self):
+        # At most one floor is being built, waiting for it lets the worker exit before the interpreter does
+        self.clear()
+        self.executor.shutdown(wait=True, cancel_futures=True)
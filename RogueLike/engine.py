@@ -5,290 +5,158 @@ Created on Sat Oct 20 14:05:46 2018
 @author: jmdow
 """
 
+import time
+
 import tdl
 
 from tcod import image_load
 
-from death_functions import kill_monster, kill_player
-from entity import get_blocking_entities_at_location
-from game_messages import Message
 from game_states import GameStates
 from input_handlers import handle_keys, handle_mouse, handle_main_menu
 from loader_functions.initialize_new_game import get_constants, get_game_variables
-from loader_functions.data_loaders import load_game, save_game
-from map_utils import next_floor
+from dungeon import Dungeon, FloorPregenerator
+from game_messages import Message
+from loader_functions.autosave import Autosaver
+from loader_functions.data_loaders import SAVE_FILE, load_game, save_game
+from loop_metrics import LoopMetrics
+from profiling import profiler
 from menus import main_menu, message_box
-from render_functions import clear_all, render_all
+from render_functions import RenderState, render_all
+from turn_logic import TurnState, step, update_fov
 
-def play_game(player, entities, game_map, message_log, game_state, root_console, con, panel, constants):
-    tdl.set_font('arial10x10.png', greyscale=True, altLayout=True)
+def wait_for_events(metrics=None):
+    # Blocks until there is input, then returns it along with everything else already queued
+    if metrics:
+        metrics.idle_start()
 
-    fov_recompute = True
+    event = tdl.event.wait(flush=False)
 
-    mouse_coordinates = (0,0)
-
-    previous_game_state = game_state
+    if metrics:
+        metrics.idle_end()
 
-    targeting_item = None
+    if event is None:
+        return []
 
-    while not tdl.event.is_window_closed():
-        if fov_recompute:
-            game_map.compute_fov(player.x, player.y, fov=constants['fov_algorithm'], radius=constants['fov_radius'],
-                                 light_walls=constants['fov_light_walls'])
-        render_all(con, panel, entities, player, game_map, fov_recompute, root_console, message_log,
-               constants['screen_width'], constants['screen_height'], constants['bar_width'],
-               constants['panel_height'], constants['panel_y'], mouse_coordinates, constants['colors'],
-               game_state)
-        tdl.flush()
+    return [event, *tdl.event.get()]
 
-        clear_all(con, entities)
 
-        fov_recompute = False
-
-        for event in tdl.event.get():
-            if event.type == 'KEYDOWN':
-                user_input = event
-                break
-            elif event.type == 'MOUSEMOTION':
-                mouse_coordinates = event.cell
-            elif event.type == 'MOUSEDOWN':
-                user_mouse_input = event
-                break
-        else:
-            user_input = None
-            user_mouse_input = None
-
-        if not (user_input or user_mouse_input):
-            continue
-
-        action = handle_keys(user_input, game_state)
-        mouse_action = handle_mouse(user_mouse_input)
-
-        move = action.get('move')
-        wait = action.get('wait')
-        pickup = action.get('pickup')
-        show_inventory = action.get('show_inventory')
-        drop_inventory = action.get('drop_inventory')
-        inventory_index = action.get('inventory_index')
-        take_stairs = action.get('take_stairs')
-        level_up = action.get('level_up')
-        show_character_screen = action.get('show_character_screen')
-        exit = action.get('exit')
-        fullscreen = action.get('fullscreen')
-
-        left_click = mouse_action.get('left_click')
-        right_click = mouse_action.get('right_click')
-
-        player_turn_results = []
-
-        if move and game_state == GameStates.PLAYERS_TURN:
-            dx, dy = move
-            destination_x = player.x + dx
-            destination_y = player.y + dy
-
-            if game_map.walkable[destination_x, destination_y]:
-                target = get_blocking_entities_at_location(entities, destination_x, destination_y)
-
-                if target:
-                    attack_results = player.fighter.attack(target)
-                    player_turn_results.extend(attack_results)
-                else:
-                    player.move(dx, dy)
-                    fov_recompute = True
-
-                game_state = GameStates.ENEMY_TURN
-
-        elif wait:
-            game_state = GameStates.ENEMY_TURN
-
-        elif pickup and game_state == GameStates.PLAYERS_TURN:
-            for entity in entities:
-                if entity.item and entity.x == player.x and entity.y == player.y:
-                    pickup_results = player.inventory.add_item(entity, constants['colors'])
-                    player_turn_results.extend(pickup_results)
-
-                    break
-            else:
-                message_log.add_message(Message('There is nothing here to pick up.', constants['colors'].get('yellow')))
-
-        if show_inventory:
-            previous_game_state = game_state
-            game_state = GameStates.SHOW_INVENTORY
-
-        if drop_inventory:
-            previous_game_state = game_state
-            game_state = GameStates.DROP_INVENTORY
-
-        if inventory_index is not None and previous_game_state != GameStates.PLAYER_DEAD and inventory_index < len(
-                player.inventory.items):
-            item = player.inventory.items[inventory_index]
-
-            if game_state == GameStates.SHOW_INVENTORY:
-                player_turn_results.extend(player.inventory.use(item, constants['colors'], entities=entities,
-                                                                game_map=game_map))
-            elif game_state == GameStates.DROP_INVENTORY:
-                player_turn_results.extend(player.inventory.drop_item(item, constants['colors']))
-
-        if take_stairs and game_state == GameStates.PLAYERS_TURN:
-            for entity in entities:
-                if entity.stairs and entity.x == player.x and entity.y == player.y:
-                    game_map, entities = next_floor(player, message_log, entity.stairs.floor, constants)
-                    fov_recompute = True
-                    con.clear()
-
-                    break
-            else:
-                message_log.add_message(Message('There are no stairs here.', constants['colors'].get('yellow')))
-
-        if level_up:
-            if level_up == 'hp':
-                player.fighter.base_max_hp += 20
-                player.fighter.hp += 20
-            elif level_up == 'str':
-                player.fighter.base_power += 1
-            elif level_up == 'def':
-                player.fighter.base_defense += 1
-
-            game_state = previous_game_state
-
-        if show_character_screen:
-            previous_game_state = game_state
-            game_state = GameStates.CHARACTER_SCREEN
-
-        if game_state == GameStates.TARGETING:
-            if left_click:
-                target_x, target_y = left_click
-
-                item_use_results = player.inventory.use(targeting_item, constants['colors'], entities=entities,
-                                                        game_map=game_map, target_x=target_x, target_y=target_y)
-                player_turn_results.extend(item_use_results)
-            elif right_click:
-                player_turn_results.append({'targeting_cancelled': True})
-
-        if exit:
-            if game_state in (GameStates.SHOW_INVENTORY, GameStates.DROP_INVENTORY, GameStates.CHARACTER_SCREEN):
-                game_state = previous_game_state
-            elif game_state == GameStates.TARGETING:
-                player_turn_results.append({'targeting_cancelled': True})
-            else:
-                save_game(player, entities, game_map, message_log, game_state)
+def play_game(player, entities, game_map, message_log, game_state, dungeon, root_console, con, panel, constants):
+    tdl.set_font('arial10x10.png', greyscale=True, altLayout=True)
 
-                return True
+    state = TurnState(player, entities, game_map, message_log, game_state, constants, dungeon)
 
-        if fullscreen:
-            tdl.set_fullscreen(not tdl.get_fullscreen())
+    render_state = RenderState()
 
-        for player_turn_result in player_turn_results:
-            message = player_turn_result.get('message')
-            dead_entity = player_turn_result.get('dead')
-            item_added = player_turn_result.get('item_added')
-            item_consumed = player_turn_result.get('consumed')
-            item_dropped = player_turn_result.get('item_dropped')
-            equip = player_turn_result.get('equip')
-            targeting = player_turn_result.get('targeting')
-            targeting_cancelled = player_turn_result.get('targeting_cancelled')
-            xp = player_turn_result.get('xp')
+    autosaver = Autosaver(SAVE_FILE, constants['autosave_interval'], dungeon)
 
-            if message:
-                message_log.add_message(message)
+    dungeon.pregenerate_below(game_map)
 
-            if dead_entity:
-                if dead_entity == player:
-                    message, game_state = kill_player(dead_entity, constants['colors'])
-                else:
-                     message = kill_monster(dead_entity, constants['colors'])
+    metrics = LoopMetrics()
 
-                message_log.add_message(message)
+    mouse_coordinates = (0,0)
+    redraw = True
 
-            if item_added:
-                entities.remove(item_added)
+    # When the input being answered arrived, for the keypress to flush latency
+    input_received = None
 
-                game_state = GameStates.ENEMY_TURN
+    while not tdl.event.is_window_closed():
+        # Nothing animates, so the screen only needs drawing after a turn or when the mouse moves to another cell
+        if redraw:
+            fov_recompute = update_fov(state)
 
-            if item_consumed:
-                game_state = GameStates.ENEMY_TURN
+            render_all(con, panel, state.entities, player, state.game_map, fov_recompute, root_console, message_log,
+                   constants['screen_width'], constants['screen_height'], constants['bar_width'],
+                   constants['panel_height'], constants['panel_y'], mouse_coordinates, constants['colors'],
+                   state.game_state, render_state)
 
-            if item_dropped:
-                entities.append(item_dropped)
+            with profiler.span('flush'):
+                tdl.flush()
 
-                game_state = GameStates.ENEMY_TURN
+            if profiler.enabled and input_received:
+                profiler.record('input_latency', input_received, time.perf_counter_ns())
+                input_received = None
 
-            if equip:
-                equip_results = player.equipment.toggle_equip(equip)
+            metrics.frame()
+            redraw = False
 
-                for equip_result in equip_results:
-                    equipped = equip_result.get('equipped')
-                    dequipped = equip_result.get('dequipped')
+            profiler.report_if_due()
 
-                    if equipped:
-                        message_log.add_message(Message(f'You equipped the {equipped.name}'))
+        user_input = None
+        user_mouse_input = None
 
-                    if dequipped:
-                        message_log.add_message(Message(f'You dequipped the {dequipped.name}'))
+        for event in wait_for_events(metrics):
+            if event.type == 'KEYDOWN':
+                user_input = event
+                break
+            elif event.type == 'MOUSEMOTION':
+                if event.cell != mouse_coordinates:
+                    mouse_coordinates = event.cell
+                    redraw = True
+            elif event.type == 'MOUSEDOWN':
+                user_mouse_input = event
+                break
 
-                game_state = GameStates.ENEMY_TURN
+        if not (user_input or user_mouse_input):
+            continue
 
+        redraw = True
+        input_received = time.perf_counter_ns()
 
-            if targeting:
-                previous_game_state = GameStates.PLAYERS_TURN
-                game_state = GameStates.TARGETING
+        with profiler.span('input'):
+            action = handle_keys(user_input, state.game_state)
+            mouse_action = handle_mouse(user_mouse_input)
 
-                targeting_item = targeting
+            if 'left_click' in mouse_action and render_state.camera:
+                # Clicks come in screen cells, targeting wants the map cell under the camera
+                mouse_action['left_click'] = render_state.camera.to_map(*mouse_action['left_click'])
 
-                message_log.add_message(targeting_item.item.targeting_message)
+        state, events = step(state, {**action, **mouse_action})
 
-            if targeting_cancelled:
-                game_state = previous_game_state
+        for event in events:
+            if event.get('new_floor'):
+                con.clear()
+                render_state.reset()
 
-                message_log.add_message(Message('Targeting cancelled'))
+                autosaver.save(player, state.entities, state.game_map, message_log, state.game_state)
 
-            if xp:
-                leveled_up = player.level.add_xp(xp)
-                message_log.add_message(Message(
-                    'You gain {0} experience points.'.format(xp)))
+            if event.get('fullscreen'):
+                tdl.set_fullscreen(not tdl.get_fullscreen())
 
-                if leveled_up:
-                    message_log.add_message(Message(
-                        'Your battle skills grow stronger! You reached level {0}'.format(player.level.current_level) + '!',
-                        constants['colors'].get('yellow')))
-                    previous_game_state = game_state
-                    game_state = GameStates.LEVEL_UP
+            if event.get('exit'):
+                autosaver.shutdown()
+                dungeon.flush()
+                save_game(player, state.entities, state.game_map, message_log, state.game_state)
 
-        if game_state == GameStates.ENEMY_TURN:
-            for entity in entities:
-                if entity.ai:
-                    enemy_turn_results = entity.ai.take_turn(player, game_map, entities)
+                if constants['show_loop_metrics']:
+                    print(metrics.report())
 
-                    for enemy_turn_result in enemy_turn_results:
-                        message = enemy_turn_result.get('message')
-                        dead_entity = enemy_turn_result.get('dead')
+                return True
 
-                        if message:
-                            message_log.add_message(message)
+        # Only save between turns, menus and targeting aren't part of the save
+        if state.game_state == GameStates.PLAYERS_TURN:
+            autosaver.save_if_due(state.turn, player, state.entities, state.game_map, message_log, state.game_state)
 
-                        if dead_entity:
-                            if dead_entity == player:
-                                message, game_state = kill_player(dead_entity, constants['colors'])
-                            else:
-                                message = kill_monster(dead_entity, constants['colors'])
+        autosave_error = autosaver.pop_error()
 
-                            message_log.add_message(message)
+        if autosave_error:
+            message_log.add_message(Message(f'Autosave failed: {autosave_error}', constants['colors'].get('red')))
 
-                            if game_state == GameStates.PLAYER_DEAD:
-                                break
+    autosaver.shutdown()
 
-                    if game_state == GameStates.PLAYER_DEAD:
-                        break
-            else:
-                game_state = GameStates.PLAYERS_TURN
+    if constants['show_loop_metrics']:
+        print(metrics.report())
 
 
 def main():
     constants = get_constants()
 
+    profiler.enable_from_environment()
+
     tdl.set_font('arial10x10.png', greyscale=True, altLayout=True)
 
     root_console = tdl.init(constants['screen_width'], constants['screen_height'], constants['window_title'])
+    # tdl.flush sleeps off whatever is left of the frame, capping how often the screen is drawn
+    tdl.set_fps(constants['fps_limit'])
     con = tdl.Console(constants['screen_width'], constants['screen_height'])
     panel = tdl.Console(constants['screen_width'], constants['panel_height'])
 
@@ -297,6 +165,8 @@ def main():
     game_map = None
     message_log = None
     game_state = None
+    pregenerator = FloorPregenerator(constants) if constants['pregenerate_floors'] else None
+    dungeon = Dungeon(constants['floor_directory'], constants['floor_cache_size'], pregenerator)
 
     show_main_menu = True
     show_load_error_message = False
@@ -304,13 +174,6 @@ def main():
     main_menu_background_image = image_load('menu_background.png')
 
     while not tdl.event.is_window_closed():
-        for event in tdl.event.get():
-            if event.type == 'KEYDOWN':
-                user_input = event
-                break
-        else:
-            user_input = None
-
         if show_main_menu:
             main_menu(con, root_console, main_menu_background_image, constants['screen_width'],
                       constants['screen_height'], constants['colors'])
@@ -321,6 +184,15 @@ def main():
 
             tdl.flush()
 
+            # The menu doesn't change until a key is pressed, so wait for one before drawing it again
+            user_input = None
+
+            while not (user_input or tdl.event.is_window_closed()):
+                for event in wait_for_events():
+                    if event.type == 'KEYDOWN':
+                        user_input = event
+                        break
+
             action = handle_main_menu(user_input)
 
             new_game = action.get('new_game')
@@ -332,11 +204,13 @@ def main():
             elif new_game:
                 player, entities, game_map, message_log, game_state = get_game_variables(constants)
                 game_state = GameStates.PLAYERS_TURN
+                dungeon.start(game_map.streams.run_seed, new_game=True)
 
                 show_main_menu = False
             elif load_saved_game:
                 try:
                     player, entities, game_map, message_log, game_state = load_game()
+                    dungeon.start(game_map.streams.run_seed)
                     show_main_menu = False
                 except FileNotFoundError:
                     show_load_error_message = True
@@ -347,9 +221,15 @@ def main():
             root_console.clear()
             con.clear()
             panel.clear()
-            play_game(player, entities, game_map, message_log, game_state, root_console, con, panel, constants)
+            play_game(player, entities, game_map, message_log, game_state, dungeon, root_console, con, panel,
+                      constants)
 
             show_main_menu = True
 
+    if pregenerator:
+        pregenerator.shutdown()
+
+    profiler.finish()
+
 if __name__ == '__main__':
     main()
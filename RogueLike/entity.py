@@ -1,5 +1,6 @@
 import math
 
+from components.component import restore_slots
 from components.item import Item
 
 from render_functions import RenderOrder
@@ -8,6 +9,9 @@ class Entity:
     '''
     A generic object to represent players, enemies, items, etc.
     '''
+    __slots__ = ('x', 'y', 'char', 'color', 'name', 'blocks', 'render_order', 'fighter', 'ai', 'item', 'inventory',
+                 'stairs', 'level', 'equipment', 'equippable', 'spatial_index')
+
     def __init__(self, x, y, char, color, name, blocks=False, render_order=RenderOrder.CORPSE, fighter=None, ai=None,
             item=None, inventory=None, stairs=None, level=None, equipment=None, equippable=None):
         self.x = x
@@ -25,6 +29,7 @@ class Entity:
         self.level = level
         self.equipment = equipment
         self.equippable = equippable
+        self.spatial_index = None
 
         if self.fighter:
             self.fighter.owner = self
@@ -52,11 +57,23 @@ class Entity:
                 self.item = item
                 self.item.owner = self
 
+        if self.fighter and self.equipment:
+            # The fighter's totals include what is equipped
+            self.fighter.update_stats()
+
+    def __setstate__(self, state):
+        restore_slots(self, state)
+
     def move(self, dx, dy):
         # Move the entity by a given amount
+        old_x, old_y = self.x, self.y
+
         self.x += dx
         self.y += dy
 
+        if self.spatial_index:
+            self.spatial_index.move(self, old_x, old_y)
+
     def move_towards(self, target_x, target_y, game_map, entities):
         path = game_map.compute_path(self.x, self.y, target_x, target_y)
 
@@ -64,9 +81,17 @@ class Entity:
             dx = path[0][0] - self.x
             dy = path[0][1] - self.y
 
-            if game_map.walkable[path[0][0], path[0][1]] and not get_blocking_entities_at_location(entities, self.x + dx, self.y + dy):
+            blocked = game_map.entity_index.blocking_entity_at(self.x + dx, self.y + dy)
+
+            if game_map.walkable[path[0][0], path[0][1]] and not blocked:
                 self.move(dx, dy)
 
+    def move_along(self, flow_field, game_map):
+        step = flow_field.next_step(self.x, self.y, game_map.entity_index.blocking_entity_at)
+
+        if step:
+            self.move(*step)
+
     def distance(self, x, y):
         return math.sqrt((x-self.x) ** 2 + (y - self.y) ** 2)
 
@@ -74,11 +99,3 @@ class Entity:
         dx = other.x - self.x
         dy = other.y - self.y
         return math.sqrt(dx**2 + dy**2)
-
-
-def get_blocking_entities_at_location(entities, destination_x, destination_y):
-    for entity in entities:
-        if entity.blocks and entity.x == destination_x and entity.y == destination_y:
-            return entity
-
-    return None
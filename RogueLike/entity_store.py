@@ -0,0 +1,199 @@
+from array import array
+from copy import copy
+
+import numpy as np
+
+from components.fighter import Fighter
+from components.item import Item
+from entity import Entity
+
+# Bits of the flags column
+BLOCKS = 1
+HAS_FIGHTER = 2
+
+INT_COLUMNS = ('x', 'y', 'hp', 'base_max_hp', 'base_power', 'base_defense', 'xp')
+
+# The Item an equippable entity gets when it has none of its own
+EQUIPPABLE_ITEM = Item()
+
+# Everything else an entity has, kept in plain lists
+OBJECT_COLUMNS = ('char', 'color', 'name', 'render_order', 'ai', 'item', 'stairs', 'equippable', 'spatial_index')
+
+
+class EntityStore:
+    '''
+    Column storage for a floor's entities, indexed by entity id. Positions, flags and fighter stats live in typed
+    arrays and the rest in lists, so an entity costs a few bytes per column instead of an object with a dict per
+    component, and queries over every entity can run on numpy views of the columns.
+    '''
+    def __init__(self):
+        for name in INT_COLUMNS:
+            setattr(self, name, array('i'))
+
+        for name in OBJECT_COLUMNS:
+            setattr(self, name, [])
+
+        self.flags = array('B')
+
+        # entity id -> its EntityView
+        self.views = []
+
+    def __len__(self):
+        return len(self.views)
+
+    def column(self, name):
+        # Only valid until the next entity is spawned, the array can't grow while numpy holds its buffer
+        return np.frombuffer(getattr(self, name), dtype=np.uint8 if name == 'flags' else np.int32)
+
+    def spawn(self, template, x, y):
+        entity_id = len(self.views)
+
+        for name in INT_COLUMNS:
+            getattr(self, name).append(0)
+
+        for name in OBJECT_COLUMNS:
+            getattr(self, name).append(None)
+
+        self.flags.append(0)
+
+        entity = EntityView(self, entity_id)
+        self.views.append(entity)
+
+        entity.x = x
+        entity.y = y
+        entity.char = template.char
+        entity.color = template.color
+        entity.name = template.name
+        entity.blocks = template.blocks
+        entity.render_order = template.render_order
+
+        if template.fighter:
+            self.flags[entity_id] |= HAS_FIGHTER
+            entity.fighter.hp = template.fighter.hp
+            entity.fighter.base_max_hp = template.fighter.base_max_hp
+            entity.fighter.base_power = template.fighter.base_power
+            entity.fighter.base_defense = template.fighter.base_defense
+            entity.fighter.xp = template.fighter.xp
+
+        if template.ai:
+            entity.ai = copy(template.ai)
+            entity.ai.owner = entity
+
+        # Nothing about an item or equippable changes after it spawns, so stored entities share the template's
+        # components outright. Their owner is left unset, nothing reads it.
+        entity.item = template.item
+        entity.equippable = template.equippable
+
+        if entity.equippable and not entity.item:
+            entity.item = EQUIPPABLE_ITEM
+
+        return entity
+
+
+def create_store(constants):
+    # Floors only get a store in the 'columns' storage mode, otherwise entities are plain objects
+    if constants['entity_storage'] == 'columns':
+        return EntityStore()
+
+    return None
+
+
+def column_property(name):
+    def get(self):
+        return getattr(self.store, name)[self.id]
+
+    def set(self, value):
+        getattr(self.store, name)[self.id] = value
+
+    return property(get, set)
+
+
+def flag_property(bit):
+    def get(self):
+        return bool(self.store.flags[self.id] & bit)
+
+    def set(self, value):
+        if value:
+            self.store.flags[self.id] |= bit
+        else:
+            self.store.flags[self.id] &= ~bit & 0xff
+
+    return property(get, set)
+
+
+class EntityView:
+    '''
+    Stands in for an Entity whose state lives in an EntityStore. Reads and writes go to the store's columns, the
+    movement and distance methods are Entity's own.
+    '''
+    __slots__ = ('store', 'id')
+
+    # Only the player has these, and the player is never stored
+    inventory = None
+    level = None
+    equipment = None
+
+    def __init__(self, store, entity_id):
+        self.store = store
+        self.id = entity_id
+
+    x = column_property('x')
+    y = column_property('y')
+    char = column_property('char')
+    color = column_property('color')
+    name = column_property('name')
+    render_order = column_property('render_order')
+    ai = column_property('ai')
+    item = column_property('item')
+    stairs = column_property('stairs')
+    equippable = column_property('equippable')
+    spatial_index = column_property('spatial_index')
+    blocks = flag_property(BLOCKS)
+
+    @property
+    def fighter(self):
+        if self.store.flags[self.id] & HAS_FIGHTER:
+            return FighterView(self.store, self.id)
+
+        return None
+
+    @fighter.setter
+    def fighter(self, fighter):
+        # Only ever cleared, when a monster dies
+        self.store.flags[self.id] &= ~HAS_FIGHTER & 0xff
+
+    move = Entity.move
+    move_towards = Entity.move_towards
+    move_along = Entity.move_along
+    distance = Entity.distance
+    distance_to = Entity.distance_to
+
+
+class FighterView:
+    '''
+    The fighter stats of a stored entity. Made on demand, the methods are Fighter's own.
+    '''
+    __slots__ = ('store', 'id')
+
+    def __init__(self, store, entity_id):
+        self.store = store
+        self.id = entity_id
+
+    @property
+    def owner(self):
+        return self.store.views[self.id]
+
+    hp = column_property('hp')
+    base_max_hp = column_property('base_max_hp')
+    base_power = column_property('base_power')
+    base_defense = column_property('base_defense')
+    xp = column_property('xp')
+
+    # Stored entities never have equipment, their totals are the base stats
+    max_hp = column_property('base_max_hp')
+    power = column_property('base_power')
+    defense = column_property('base_defense')
+
+    take_damage = Fighter.take_damage
+    heal = Fighter.heal
+    attack = Fighter.attack
@@ -0,0 +1,112 @@
+import json
+from copy import copy
+
+from components.ai import BasicMonster
+from components.equippable import Equippable
+from components.fighter import Fighter
+from components.item import Item
+from entity import Entity
+from equipment_slots import EquipmentSlots
+from game_messages import Message
+import item_functions
+from random_utils import AliasTable, from_dungeon_level
+from render_functions import RenderOrder
+
+TEMPLATE_FILE = 'entities.json'
+
+AI_TYPES = {
+    'basic': BasicMonster
+}
+
+
+class EntityTemplate:
+    '''
+    One kind of monster or item. The prototype components are built once, spawning shallow-copies them, so every
+    instance shares the kind's targeting message and item arguments and only gets its own mutable state.
+    '''
+    def __init__(self, key, data, colors):
+        self.key = key
+        self.name = data['name']
+        self.char = data['char']
+        self.color = colors.get(data['color'])
+        self.blocks = data.get('blocks', False)
+        self.render_order = RenderOrder[data.get('render_order', 'CORPSE')]
+        self.spawn_chances = data.get('spawn', [])
+
+        self.fighter = Fighter(**data['fighter']) if 'fighter' in data else None
+        self.ai = AI_TYPES[data['ai']]() if 'ai' in data else None
+        self.item = None
+        self.equippable = None
+
+        if 'item' in data:
+            item = data['item']
+            targeting_message = None
+
+            if 'targeting_message' in item:
+                text, color = item['targeting_message']
+                targeting_message = Message(text, colors.get(color))
+
+            self.item = Item(use_function=getattr(item_functions, item['use_function']),
+                             targeting=item.get('targeting', False), targeting_message=targeting_message,
+                             **item.get('kwargs', {}))
+
+        if 'equippable' in data:
+            equippable = dict(data['equippable'])
+            slot = EquipmentSlots[equippable.pop('slot')]
+
+            self.equippable = Equippable(slot, **equippable)
+
+    def spawn(self, x, y, store=None):
+        if store is not None:
+            return store.spawn(self, x, y)
+
+        return Entity(x, y, self.char, self.color, self.name, blocks=self.blocks, render_order=self.render_order,
+                      fighter=copy(self.fighter) if self.fighter else None,
+                      ai=copy(self.ai) if self.ai else None,
+                      item=copy(self.item) if self.item else None,
+                      equippable=copy(self.equippable) if self.equippable else None)
+
+
+class SpawnTable:
+    '''
+    What the rooms of one dungeon level get: how many monsters and items at most, and samplers for which ones.
+    '''
+    def __init__(self, registry, dungeon_level):
+        self.max_monsters_per_room = from_dungeon_level(registry.room_limits['max_monsters'], dungeon_level)
+        self.max_items_per_room = from_dungeon_level(registry.room_limits['max_items'], dungeon_level)
+
+        self.monsters = AliasTable({key: from_dungeon_level(registry.templates[key].spawn_chances, dungeon_level)
+                                    for key in registry.monsters})
+        self.items = AliasTable({key: from_dungeon_level(registry.templates[key].spawn_chances, dungeon_level)
+                                 for key in registry.items})
+
+
+class TemplateRegistry:
+    '''
+    Every entity template from the data file, and the spawn tables built from them, one per dungeon level.
+    '''
+    def __init__(self, data, colors):
+        self.room_limits = data['room_limits']
+        self.monsters = list(data['monsters'])
+        self.items = list(data['items'])
+
+        self.templates = {}
+
+        for key, template_data in list(data['monsters'].items()) + list(data['items'].items()):
+            self.templates[key] = EntityTemplate(key, template_data, colors)
+
+        self.spawn_tables = {}
+
+    @classmethod
+    def load(cls, colors, path=TEMPLATE_FILE):
+        with open(path) as template_file:
+            return cls(json.load(template_file), colors)
+
+    def spawn(self, key, x, y, store=None):
+        return self.templates[key].spawn(x, y, store)
+
+    def spawn_table(self, dungeon_level):
+        if dungeon_level not in self.spawn_tables:
+            self.spawn_tables[dungeon_level] = SpawnTable(self, dungeon_level)
+
+        return self.spawn_tables[dungeon_level]
@@ -4,3 +4,7 @@ from enum import Enum
 class EquipmentSlots(Enum):
     MAIN_HAND = 1
     OFF_HAND = 2
+
+    @property
+    def label(self):
+        return self.name.lower().replace('_', ' ')
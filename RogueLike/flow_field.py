@@ -0,0 +1,102 @@
+import numpy as np
+
+UNREACHABLE = np.iinfo(np.int32).max
+
+NEIGHBOURS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+
+# Monsters further away than this (in steps) from their target don't get a path
+MAX_DISTANCE = 30
+
+
+def compute_distance_field(walkable, target_x, target_y, max_distance=MAX_DISTANCE):
+    '''
+    Number of steps (diagonals included) from every walkable tile to the target, computed as a
+    breadth-first search where each ring is grown for the whole search window at once. Nothing past
+    max_distance can be reached, so only the window around the target is searched. Returns the window's
+    corner on the map and the distances inside it.
+    '''
+    width, height = walkable.shape
+
+    x1 = max(target_x - max_distance, 0)
+    y1 = max(target_y - max_distance, 0)
+    x2 = min(target_x + max_distance + 1, width)
+    y2 = min(target_y + max_distance + 1, height)
+
+    window = np.full((x2 - x1, y2 - y1), UNREACHABLE, dtype=np.int32)
+    window[target_x - x1, target_y - y1] = 0
+
+    frontier = np.zeros(window.shape, dtype=np.bool_)
+    frontier[target_x - x1, target_y - y1] = True
+
+    unvisited = walkable.window(x1, y1, x2, y2)
+    unvisited[target_x - x1, target_y - y1] = False
+
+    rows = np.empty_like(frontier)
+    grown = np.empty_like(frontier)
+
+    for steps in range(1, max_distance + 1):
+        # Growing along x and then along y covers all eight neighbours
+        rows[...] = frontier
+        rows[1:, :] |= frontier[:-1, :]
+        rows[:-1, :] |= frontier[1:, :]
+
+        grown[...] = rows
+        grown[:, 1:] |= rows[:, :-1]
+        grown[:, :-1] |= rows[:, 1:]
+
+        np.logical_and(grown, unvisited, out=frontier)
+
+        if not frontier.any():
+            break
+
+        window[frontier] = steps
+        unvisited &= ~frontier
+
+    return x1, y1, window
+
+
+class FlowField:
+    '''
+    Distance to one target shared by every monster chasing it, each monster just walks downhill.
+    '''
+    def __init__(self, walkable, target_x, target_y, version=0, max_distance=MAX_DISTANCE):
+        self.target_x = target_x
+        self.target_y = target_y
+        self.version = version
+        self.x1, self.y1, self.distance = compute_distance_field(walkable, target_x, target_y, max_distance)
+
+    def distance_at(self, x, y):
+        x -= self.x1
+        y -= self.y1
+        width, height = self.distance.shape
+
+        if 0 <= x < width and 0 <= y < height:
+            return self.distance[x, y]
+
+        return UNREACHABLE
+
+    def next_step(self, x, y, is_blocked):
+        # Returns the (dx, dy) towards the unblocked neighbour closest to the target, or None to stay put
+        current = self.distance_at(x, y)
+
+        best_step = None
+        best_key = None
+
+        for dx, dy in NEIGHBOURS:
+            nx = x + dx
+            ny = y + dy
+
+            distance = self.distance_at(nx, ny)
+
+            if distance >= current or is_blocked(nx, ny):
+                continue
+
+            # On ties prefer the tile that is closer in a straight line, so monsters don't zig-zag
+            key = (distance, (self.target_x - nx) ** 2 + (self.target_y - ny) ** 2)
+
+            if best_key is None or key < best_key:
+                best_step = (dx, dy)
+                best_key = key
+
+        return best_step
@@ -0,0 +1,228 @@
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+from tdl.map import Map
+
+from chunked_grid import is_index
+
+# Fields of view kept per map, enough for every tile of a few rooms and the corridors between them
+FOV_CACHE_SIZE = 64
+
+
+@lru_cache(maxsize=None)
+def circle_mask(radius):
+    # Which offsets from a centre lie within radius of it, indexed as mask[dx + r, dy + r] with r = int(radius)
+    r = int(radius)
+    offsets = np.arange(-r, r + 1)
+
+    mask = offsets[:, None] ** 2 + offsets[None, :] ** 2 <= radius ** 2
+    mask.flags.writeable = False
+
+    return mask
+
+
+def symmetric_shadowcast(transparent, radius, light_walls=True):
+    '''
+    Field of view from the centre of a (2 * radius + 1) square window of the map's transparency, by symmetric
+    shadowcasting: a floor tile is visible if and only if the centre would be visible from it. The four quadrants
+    are scanned on rotated views of the window and slopes are kept as integer fractions so the result is exact.
+    Returns which tiles of the window are lit.
+    '''
+    seen = np.zeros(transparent.shape, dtype=np.bool_)
+    seen[radius, radius] = True
+
+    # Rotating the window around the origin turns each quadrant into rows going down from it
+    for turns in range(4):
+        cast_quadrant(np.rot90(transparent, turns), np.rot90(seen, turns), radius)
+
+    if not light_walls:
+        seen &= transparent
+        seen[radius, radius] = True
+
+    return seen
+
+
+def cast_quadrant(transparent, seen, radius):
+    # Rows are a dozen tiles wide at most, plain lists walk them faster than numpy calls would
+    transparent = transparent.tolist()
+    lit = []
+
+    # Rows still to scan, as depth and the start and end slopes as numerator, denominator pairs
+    rows = [(1, -1, 1, 1, 1)]
+
+    while rows:
+        depth, start_n, start_d, end_n, end_d = rows.pop()
+
+        if depth > radius:
+            continue
+
+        # The columns whose centre lies within the slopes, ties rounded towards the inside
+        min_col = (2 * depth * start_n + start_d) // (2 * start_d)
+        max_col = -((end_d - 2 * depth * end_n) // (2 * end_d))
+
+        row = transparent[radius + depth]
+        previous = None
+
+        for col in range(min_col, max_col + 1):
+            floor = row[radius + col]
+
+            # Walls are lit whenever the scan reaches them, floors only when the slopes cover their centre
+            if not floor or (col * start_d >= depth * start_n and col * end_d <= depth * end_n):
+                lit.append((radius + depth, radius + col))
+
+            # Every run of floor tiles casts the next row down, narrowed to the walls on either side of it
+            if previous is False and floor:
+                start_n, start_d = 2 * col - 1, 2 * depth
+            elif previous and not floor:
+                rows.append((depth + 1, start_n, start_d, 2 * col - 1, 2 * depth))
+
+            previous = floor
+
+        if previous:
+            rows.append((depth + 1, start_n, start_d, end_n, end_d))
+
+    if lit:
+        lit_rows, lit_cols = zip(*lit)
+        seen[lit_rows, lit_cols] = True
+
+
+def window_radius(game_map, radius):
+    # How far the window a field is computed on reaches, a radius of 0 means no limit like tdl's
+    return radius if radius > 0 else max(game_map.width, game_map.height)
+
+
+class TdlFov:
+    '''
+    One of tdl's own algorithms, run on a tdl map holding only the window around the viewer.
+    '''
+    def __init__(self, algorithm):
+        self.name = algorithm
+
+    def compute(self, game_map, x, y, radius, light_walls):
+        # Returns the corner of the window on the map and its lit tiles
+        r = window_radius(game_map, radius)
+
+        area = Map(2 * r + 1, 2 * r + 1)
+        area.transparent[:] = game_map.transparent.window(x - r, y - r, x + r + 1, y + r + 1)
+
+        return x - r, y - r, area.compute_fov(r, r, fov=self.name, radius=radius, light_walls=light_walls).copy()
+
+
+class ShadowcastFov:
+    '''
+    Symmetric shadowcasting on the window of the map's transparency around the viewer.
+    '''
+    name = 'SYMMETRIC_SHADOWCAST'
+
+    def compute(self, game_map, x, y, radius, light_walls):
+        r = window_radius(game_map, radius)
+
+        window = game_map.transparent.window(x - r, y - r, x + r + 1, y + r + 1)
+        seen = symmetric_shadowcast(window, r, light_walls)
+
+        if radius > 0:
+            # Trim the square scanned to a circle
+            seen &= circle_mask(radius)
+
+        return x - r, y - r, seen
+
+
+FOV_ENGINES = {
+    ShadowcastFov.name: ShadowcastFov()
+}
+
+
+def get_fov_engine(algorithm):
+    # Anything that isn't one of ours is left to tdl
+    if algorithm not in FOV_ENGINES:
+        FOV_ENGINES[algorithm] = TdlFov(algorithm)
+
+    return FOV_ENGINES[algorithm]
+
+
+class FieldOfView:
+    '''
+    What the last field of view lit, kept as the window of the map it was computed on. Indexed like the map,
+    everything outside the window is dark.
+    '''
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.x1 = 0
+        self.y1 = 0
+        self.window = np.zeros((0, 0), dtype=np.bool_)
+
+    def set(self, x1, y1, window):
+        # Cropped to the map, tdl lights the walls along the window's edge even where the map has ended
+        left = max(x1, 0)
+        top = max(y1, 0)
+
+        self.window = window[left - x1:self.width - x1, top - y1:self.height - y1]
+        self.x1 = left
+        self.y1 = top
+
+    def __getitem__(self, position):
+        x, y = position
+        width, height = self.window.shape
+
+        if is_index(x) and is_index(y):
+            x -= self.x1
+            y -= self.y1
+
+            return 0 <= x < width and 0 <= y < height and bool(self.window[x, y])
+
+        xs = np.asarray(x) - self.x1
+        ys = np.asarray(y) - self.y1
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+
+        lit = np.zeros(xs.shape, dtype=np.bool_)
+        lit[inside] = self.window[xs[inside], ys[inside]]
+
+        return lit
+
+    def area(self, x1, y1, x2, y2):
+        # A dense copy of [x1, x2) x [y1, y2) of the field
+        area = np.zeros((x2 - x1, y2 - y1), dtype=np.bool_)
+        width, height = self.window.shape
+
+        left = max(x1, self.x1)
+        top = max(y1, self.y1)
+        right = min(x2, self.x1 + width)
+        bottom = min(y2, self.y1 + height)
+
+        if right > left and bottom > top:
+            area[left - x1:right - x1, top - y1:bottom - y1] = self.window[left - self.x1:right - self.x1,
+                                                                           top - self.y1:bottom - self.y1]
+
+        return area
+
+
+class FovCache:
+    '''
+    Fields of view already computed on one map, keyed by where and how they were computed. Only a change to which
+    tiles are transparent makes them stale, and then all of them are. Past capacity the least recently used is
+    dropped.
+    '''
+    def __init__(self, capacity=FOV_CACHE_SIZE):
+        self.capacity = capacity
+        self.fields = OrderedDict()
+        self.transparency_version = None
+
+    def get(self, transparency_version, key, compute):
+        if transparency_version != self.transparency_version:
+            self.fields.clear()
+            self.transparency_version = transparency_version
+
+        field = self.fields.get(key)
+
+        if field is None:
+            field = compute()
+            self.fields[key] = field
+
+            if len(self.fields) > self.capacity:
+                self.fields.popitem(last=False)
+        else:
+            self.fields.move_to_end(key)
+
+        return field
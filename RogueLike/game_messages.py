@@ -1,25 +1,67 @@
 import textwrap
+from collections import deque
+from functools import lru_cache
 
 class Message:
     def __init__(self, text, color=(255,255,255)):
         self.text = text
         self.color = color
 
+@lru_cache(maxsize=4096)
+def wrap_text(text, width):
+    return tuple(textwrap.wrap(text, width))
+
 class MessageLog:
-    def __init__(self, x, width, height):
-        self.messages = []
+    '''
+    Every message as it was added, up to capacity, oldest dropped first. Messages are only wrapped into lines
+    when something displays them.
+    '''
+    def __init__(self, x, width, height, capacity=1000):
+        self.history = deque(maxlen=capacity)
         self.x = x
         self.width = width
         self.height = height
+        self.version = 0
+
+        # How many lines up from the newest the history view is scrolled
+        self.scroll_offset = 0
+
+    @property
+    def messages(self):
+        # The lines that fit in the panel
+        return self.lines(self.height, self.width)
 
     def add_message(self, message):
-        # Split the message if necessary, over multiple lines
-        new_msg_lines = textwrap.wrap(message.text, self.width)
+        self.history.append(message)
+        self.version += 1
+
+    def lines(self, count, width, skip=0):
+        # The newest `count` lines wrapped to `width`, after skipping `skip` lines from the bottom, oldest first
+        lines = []
+
+        for message in reversed(self.history):
+            for text in reversed(wrap_text(message.text, width)):
+                if skip:
+                    skip -= 1
+                    continue
+
+                lines.append(Message(text, message.color))
+
+                if len(lines) == count:
+                    return lines[::-1]
+
+        return lines[::-1]
+
+    def scroll(self, amount):
+        self.scroll_offset = max(0, self.scroll_offset + amount)
+
+    def clamp_scroll(self, width, height):
+        # Keep the scroll offset within the lines there are, so a page is only ever known by one offset
+        total = sum(len(wrap_text(message.text, width)) for message in self.history)
+        self.scroll_offset = max(0, min(self.scroll_offset, total - height))
 
-        for line in new_msg_lines:
-            # If the buffer is full, remove first line to make room for new one
-            if len(self.messages) == self.height:
-                del self.messages[0]
+    def scrollback(self, width, height):
+        # The page of history at the current scroll offset
+        self.clamp_scroll(width, height)
 
-            #Add new line as Message object, with text and color
-            self.messages.append(Message(line, message.color))
+        return self.lines(height, width, self.scroll_offset)
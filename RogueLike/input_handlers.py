@@ -14,6 +14,8 @@ def handle_keys(user_input, game_state):
             return handle_level_up_menu(user_input)
         elif game_state == GameStates.CHARACTER_SCREEN:
             return handle_character_screen(user_input)
+        elif game_state == GameStates.MESSAGE_HISTORY:
+            return handle_message_history_keys(user_input)
 
     return {}
 
@@ -47,8 +49,12 @@ def handle_player_turn_keys(user_input):
         return{'drop_inventory': True}
     elif key_char == '.' and user_input.shift:
         return {'take_stairs': True}
+    elif key_char == ',' and user_input.shift:
+        return {'take_stairs': True}
     elif key_char == 'c':
         return {'show_character_screen': True}
+    elif key_char == 'm':
+        return {'show_message_history': True}
 
     if user_input.key == 'ENTER' and user_input.alt:
         # Alt+Enter: toggle full screen
@@ -71,6 +77,8 @@ def handle_player_dead_keys(user_input):
 
     if key_char == 'i':
         return {'show_inventory': True}
+    elif key_char == 'm':
+        return {'show_message_history': True}
 
     if user_input.key == 'ENTER' and user_input.alt:
         # Alt+Enter: toggle full screen
@@ -141,3 +149,19 @@ def handle_character_screen(user_input):
         return {'exit': True}
 
     return {}
+
+def handle_message_history_keys(user_input):
+    key_char = user_input.char
+
+    if user_input.key == 'UP' or key_char == 'k':
+        return {'scroll_history': 1}
+    elif user_input.key == 'DOWN' or key_char == 'j':
+        return {'scroll_history': -1}
+    elif user_input.key == 'PAGEUP':
+        return {'scroll_history': 10}
+    elif user_input.key == 'PAGEDOWN':
+        return {'scroll_history': -10}
+    elif user_input.key == 'ESCAPE' or key_char == 'm':
+        return {'exit': True}
+
+    return {}
@@ -1,5 +1,6 @@
 from components.ai import ConfusedMonster
 from game_messages import Message
+from target_queries import fighters_within, nearest_hostiles
 
 def heal(*args, **kwargs):
     entity = args[0]
@@ -19,34 +20,25 @@ def heal(*args, **kwargs):
 def cast_lightning(*args, **kwargs):
     caster = args[0]
     colors = args[1]
-    entities = kwargs.get('entities')
     game_map = kwargs.get('game_map')
     damage = kwargs.get('damage')
     maximum_range = kwargs.get('maximum_range')
 
     results = []
 
-    target = None
-    closest_distance = maximum_range + 1
-
-    for entity in entities:
-        if entity.fighter and entity != caster and game_map.fov[entity.x, entity.y]:
-            distance = caster.distance_to(entity)
+    targets = nearest_hostiles(game_map, caster, maximum_range)
 
-            if distance < closest_distance:
-                target = entity
-                closest_distance = distance
-    if target:
+    if targets:
+        target = targets[0]
         results.append({'consumed':True, 'target':target, 'message': Message('You cast lighting at the {0}! The damage is {1}'.format(target.name, damage))})
         results.extend(target.fighter.take_damage(damage))
     else:
-        result.append({'consumed': False, 'target': None, 'message': Message('No enemy is present.', colors.get('red'))})
+        results.append({'consumed': False, 'target': None, 'message': Message('No enemy is present.', colors.get('red'))})
 
     return results
 
 def cast_fireball(*args, **kwargs):
     colors = args[1]
-    entities = kwargs.get('entities')
     game_map = kwargs.get('game_map')
     damage = kwargs.get('damage')
     radius = kwargs.get('radius')
@@ -62,13 +54,13 @@ def cast_fireball(*args, **kwargs):
 
     results.append({'consumed': True,
                     'message': Message('A fiery explosion happens within {0} tiles!'.format(radius),
-                                       colors.get('orange'))})
+                                       colors.get('orange')),
+                    'noise': (target_x, target_y, radius * 2)})
 
-    for entity in entities:
-        if entity.distance(target_x, target_y) <= radius and entity.fighter:
-            results.append({'message': Message('The {0} gets burned for {1} hit points.'.format(entity.name, damage),
-                                               colors.get('orange'))})
-            results.extend(entity.fighter.take_damage(damage))
+    for entity in fighters_within(game_map, target_x, target_y, radius):
+        results.append({'message': Message('The {0} gets burned for {1} hit points.'.format(entity.name, damage),
+                                           colors.get('orange'))})
+        results.extend(entity.fighter.take_damage(damage))
 
     return results
 
@@ -93,6 +85,7 @@ def cast_confuse(*args, **kwargs):
             confused_ai.owner = entity
             entity.ai = confused_ai
 
+            results.append({'wake': entity})
             results.append({'consumed': True, 'message': Message("The {0}'s eyes gloss over in confusion!".format(entity.name),
                                                                  colors.get('light_green'))})
 
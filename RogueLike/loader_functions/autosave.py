@@ -0,0 +1,61 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from loader_functions.save_format import snapshot_game, write_snapshot
+
+
+class Autosaver:
+    '''
+    Saves in the background. The main thread only takes a snapshot of the game, encoding, compressing and
+    writing it happen on a worker thread. Floors the dungeon holds in memory are written with every save, so
+    the floor files always match the last save.
+    '''
+    def __init__(self, path, interval, dungeon=None):
+        self.path = path
+        self.interval = interval
+        self.dungeon = dungeon
+        self.last_turn = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='autosave')
+        self.pending = None
+        self.pending_floors = []
+        self.error = None
+
+    def save(self, player, entities, game_map, message_log, game_state):
+        snapshot = snapshot_game(player, entities, game_map, message_log, game_state)
+        floors = self.dungeon.unsaved_floors() if self.dungeon else []
+
+        if self.pending and self.pending.cancel():
+            # A save that hasn't started yet is out of date now, only the newest snapshot is worth writing. The
+            # floors it carried still have to be.
+            floors = self.pending_floors + floors
+
+        self.pending_floors = floors
+        self.pending = self.executor.submit(write_save, snapshot, self.path, floors)
+        self.pending.add_done_callback(self._check)
+
+    def save_if_due(self, turn, player, entities, game_map, message_log, game_state):
+        if turn - self.last_turn >= self.interval:
+            self.last_turn = turn
+            self.save(player, entities, game_map, message_log, game_state)
+
+    def _check(self, future):
+        if not future.cancelled() and future.exception():
+            self.error = future.exception()
+
+    def pop_error(self):
+        error, self.error = self.error, None
+
+        return error
+
+    def shutdown(self):
+        # Waits for the last write, so nothing else touches the save file while it is still being written
+        self.executor.shutdown(wait=True)
+
+
+def write_save(snapshot, path, floors):
+    # The floors go first, a save is never on disk without the floors it expects
+    for floor_snapshot, floor_path in floors:
+        os.makedirs(os.path.dirname(floor_path), exist_ok=True)
+        write_snapshot(floor_snapshot, floor_path)
+
+    write_snapshot(snapshot, path)
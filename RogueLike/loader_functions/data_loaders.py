@@ -1,20 +1,36 @@
 import os
 import shelve
+from collections import deque
+
+from components.ai import ConfusedMonster
+from random_utils import RandomStreams
+from spatial_index import SpatialIndex
+from loader_functions.save_format import read_snapshot, restore_game, snapshot_game, write_snapshot
+
+SAVE_FILE = 'savegame.sav'
+
+# Saves written by older versions, a shelve database
+SHELVE_FILE = 'savegame'
 
 
 def save_game(player, entities, game_map, message_log, game_state):
-    with shelve.open('savegame', 'n') as data_file:
-        data_file['player_index'] = entities.index(player)
-        data_file['entities'] = entities
-        data_file['game_map'] = game_map
-        data_file['message_log'] = message_log
-        data_file['game_state'] = game_state
+    write_snapshot(snapshot_game(player, entities, game_map, message_log, game_state), SAVE_FILE)
 
 def load_game():
-    if not os.path.isfile('savegame.dat'):
+    if os.path.isfile(SAVE_FILE):
+        return restore_game(read_snapshot(SAVE_FILE))
+
+    if not os.path.isfile(SHELVE_FILE + '.dat'):
         raise FileNotFoundError
 
-    with shelve.open('savegame', 'r') as data_file:
+    # Migrate an old shelve save to the new format, the shelve files are left in place
+    player, entities, game_map, message_log, game_state = load_shelve_game()
+    save_game(player, entities, game_map, message_log, game_state)
+
+    return player, entities, game_map, message_log, game_state
+
+def load_shelve_game():
+    with shelve.open(SHELVE_FILE, 'r') as data_file:
         player_index = data_file['player_index']
         entities = data_file['entities']
         game_map = data_file['game_map']
@@ -23,4 +39,45 @@ def load_game():
 
     player = entities[player_index]
 
+    if not hasattr(game_map, 'entity_index'):
+        # Saves made before the map owned a spatial index
+        game_map.entity_index = SpatialIndex()
+        game_map.entity_index.rebuild(entities)
+
+    # Maps from before chunked storage are converted as they are unpickled, see GameMap.__setstate__
+
+    if not hasattr(game_map, 'streams'):
+        # Saves made before generation was seeded
+        game_map.streams = RandomStreams()
+        game_map.ai_random = game_map.streams.stream('ai', game_map.dungeon_level)
+
+    if not hasattr(player.fighter, 'power'):
+        # Saves made before fighters and equipment cached their totals
+        player.equipment.update_bonuses()
+
+        for entity in entities:
+            if entity.fighter:
+                entity.fighter.update_stats()
+
+    if not hasattr(message_log, 'version'):
+        message_log.version = 0
+
+    if not hasattr(message_log, 'history'):
+        # Saves made before the log kept its history, all it had were the wrapped lines on display
+        lines = vars(message_log).pop('messages')
+        message_log.history = deque(lines, maxlen=1000)
+        message_log.scroll_offset = 0
+
+    if not hasattr(game_map, 'awake_entities'):
+        # Saves made before monsters could sleep, everything starts awake
+        game_map.awake_entities = {}
+
+        for entity in entities:
+            if entity.ai:
+                # A confused monster goes back to the AI it wraps, that is the one that needs the new fields
+                ai = entity.ai.previous_ai if isinstance(entity.ai, ConfusedMonster) else entity.ai
+                ai.patience = 10
+                ai.turns_unseen = 0
+                game_map.wake(entity)
+
     return player, entities, game_map, message_log, game_state
@@ -2,9 +2,9 @@ from components.fighter import Fighter
 from components.inventory import Inventory
 from components.levels import Level
 from components.equipment import Equipment
-from components.equippable import Equippable
 from entity import Entity
-from equipment_slots import EquipmentSlots
+from entity_store import create_store
+from entity_templates import TemplateRegistry
 from game_messages import MessageLog
 from game_states import GameStates
 from map_utils import GameMap, make_map
@@ -23,18 +23,47 @@ def get_constants():
     message_x = bar_width + 2
     message_width = screen_width - bar_width - 2
     message_height = panel_height - 1
+    # Messages kept for the history view, the oldest are dropped beyond this
+    message_capacity = 1000
 
+    # Maps can be bigger than the screen, the camera scrolls to keep the player in view
     map_width = 80
     map_height = 43
 
     room_max_size = 10
     room_min_size = 6
     max_rooms = 30
+    # 'ROOMS' scatters rooms at random and drops those that overlap, 'BSP' splits the map into parts with a room
+    # in each, which packs large floors without wasted attempts
+    map_generator = 'ROOMS'
 
+    # One of tdl's algorithms, or 'SYMMETRIC_SHADOWCAST' for the one in fov.py
     fov_algorithm = 'BASIC'
     fov_light_walls = True
     fov_radius = 10
 
+    # How far the sound of the player's attacks carries, monsters within it wake up
+    noise_radius = 6
+
+    # Turns between background autosaves, the game is also saved on every new floor
+    autosave_interval = 50
+
+    # Floors the player left are kept in memory up to this many, older ones are written to floor_directory
+    floor_cache_size = 3
+    floor_directory = 'floors'
+
+    # Build the next floor down in a background process while the current one is played
+    pregenerate_floors = True
+
+    # 'objects' keeps every entity a plain object, 'columns' spawns monsters and items into an array-backed
+    # EntityStore per floor, for floors with very many entities
+    entity_storage = 'objects'
+
+    # The screen is redrawn at most this often, and only when something changed
+    fps_limit = 60
+    # Print the main loop's frame rate and idle CPU use when a game ends
+    show_loop_metrics = False
+
     max_monsters_per_room = 3
     max_items_per_room = 2
 
@@ -74,22 +103,33 @@ def get_constants():
         'message_x': message_x,
         'message_width': message_width,
         'message_height': message_height,
+        'message_capacity': message_capacity,
         'map_width': map_width,
         'map_height': map_height,
         'room_max_size': room_max_size,
         'room_min_size': room_min_size,
         'max_rooms': max_rooms,
+        'map_generator': map_generator,
         'fov_algorithm': fov_algorithm,
         'fov_light_walls': fov_light_walls,
         'fov_radius': fov_radius,
+        'noise_radius': noise_radius,
+        'autosave_interval': autosave_interval,
+        'floor_cache_size': floor_cache_size,
+        'floor_directory': floor_directory,
+        'pregenerate_floors': pregenerate_floors,
+        'entity_storage': entity_storage,
+        'fps_limit': fps_limit,
+        'show_loop_metrics': show_loop_metrics,
         'max_monsters_per_room': max_monsters_per_room,
         'max_items_per_room': max_items_per_room,
-        'colors': colors
+        'colors': colors,
+        'entity_templates': TemplateRegistry.load(colors)
     }
 
     return constants
 
-def get_game_variables(constants):
+def get_game_variables(constants, run_seed=None):
     fighter_component = Fighter(hp=100, defense=1, power=2)
     inventory_component = Inventory(26)
     level_component = Level()
@@ -99,18 +139,18 @@ def get_game_variables(constants):
                     equipment=equipment_component)
     entities = [player]
 
-    equippable_component = Equippable(EquipmentSlots.MAIN_HAND, power_bonus=2)
-    text_editor = Entity(0, 0, '-', constants['colors'].get('sky'), 'Dagger', equippable=equippable_component)
+    text_editor = constants['entity_templates'].spawn('dagger', 0, 0)
     player.inventory.add_item(text_editor, constants['colors'])
     player.equipment.toggle_equip(text_editor)
 
-    game_map = GameMap(constants['map_width'], constants['map_height'])
+    game_map = GameMap(constants['map_width'], constants['map_height'], run_seed=run_seed,
+                       entity_store=create_store(constants))
     make_map(game_map, constants['max_rooms'], constants['room_min_size'],
              constants['room_max_size'], constants['map_width'], constants['map_height'], player, entities,
-             constants['colors'])
+             constants['entity_templates'], constants['map_generator'])
 
     message_log = MessageLog(constants['message_x'], constants['message_width'],
-                             constants['message_height'])
+                             constants['message_height'], constants['message_capacity'])
 
     game_state = GameStates.PLAYERS_TURN
 
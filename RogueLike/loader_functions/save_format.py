@@ -0,0 +1,504 @@
+"""
+Binary save format.
+
+    magic (4 bytes) | format version (uint16) | flags (uint16) | header length (uint32) | header | array blocks
+
+The header is zlib-compressed JSON holding the scalar state and, for every array block, its name, dtype, shape,
+offset and size. Map layers and entity columns are stored as raw array bytes (zlib-compressed unless the save was
+written with compress=False), so loading is a frombuffer per block instead of unpickling an object graph, and the
+blocks of an uncompressed save can be memory-mapped as they are. A snapshot is the plain {'meta': ..., 'arrays': ...}
+dict that gets written, taking one is cheap and never touches the disk.
+"""
+
+import json
+import os
+import struct
+import tempfile
+import zlib
+from copy import copy
+
+import numpy as np
+
+from chunked_grid import ChunkedGrid, PackedChunkedGrid
+from components.ai import BasicMonster, ConfusedMonster
+from components.equipment import Equipment
+from components.equippable import Equippable
+from components.fighter import Fighter
+from components.inventory import Inventory
+from components.item import Item
+from components.levels import Level
+from components.stairs import Stairs
+from entity import Entity
+from entity_store import EntityStore
+from equipment_slots import EquipmentSlots
+from game_messages import Message, MessageLog
+from game_states import GameStates
+import item_functions
+from map_utils import GameMap
+from packed_grid import PackedBoolGrid
+from render_functions import RenderOrder
+import tile_types
+
+MAGIC = b'RLSV'
+FORMAT_VERSION = 7
+
+FLAG_COMPRESSED = 0x1
+
+HEADER = struct.Struct('<4sHHI')
+
+# Entity locations
+ON_FLOOR = 0
+IN_INVENTORY = 1
+
+# AI kinds
+NO_AI = 0
+BASIC_AI = 1
+CONFUSED_AI = 2
+
+
+class SaveFormatError(Exception):
+    pass
+
+
+def snapshot_entities(entities, inventory_items=()):
+    # Columnar copy of the entities. Numbers go in arrays, the few strings and dicts in the returned meta.
+    all_entities = list(entities) + list(inventory_items)
+    count = len(all_entities)
+
+    columns = {
+        'x': np.zeros(count, dtype=np.int32),
+        'y': np.zeros(count, dtype=np.int32),
+        'char': np.zeros(count, dtype=np.uint32),
+        'color': np.zeros((count, 3), dtype=np.uint8),
+        'blocks': np.zeros(count, dtype=np.bool_),
+        'render_order': np.zeros(count, dtype=np.uint8),
+        'location': np.zeros(count, dtype=np.uint8),
+        'has_fighter': np.zeros(count, dtype=np.bool_),
+        'hp': np.zeros(count, dtype=np.int32),
+        'base_max_hp': np.zeros(count, dtype=np.int32),
+        'base_power': np.zeros(count, dtype=np.int32),
+        'base_defense': np.zeros(count, dtype=np.int32),
+        'xp': np.zeros(count, dtype=np.int32),
+        'ai': np.zeros(count, dtype=np.uint8),
+        'awake': np.zeros(count, dtype=np.bool_),
+        'patience': np.zeros(count, dtype=np.int32),
+        'turns_unseen': np.zeros(count, dtype=np.int32),
+        'confused_turns': np.zeros(count, dtype=np.int32),
+        'has_item': np.zeros(count, dtype=np.bool_),
+        'item_kind': np.full(count, -1, dtype=np.int32),
+        'targeting': np.zeros(count, dtype=np.bool_),
+        'equip_slot': np.zeros(count, dtype=np.uint8),
+        'power_bonus': np.zeros(count, dtype=np.int32),
+        'defense_bonus': np.zeros(count, dtype=np.int32),
+        'max_hp_bonus': np.zeros(count, dtype=np.int32),
+        'stairs_floor': np.zeros(count, dtype=np.int32)
+    }
+
+    names = []
+
+    # Items of one kind share their use function, message and arguments, each kind is written once
+    item_kinds = []
+    item_kind_ids = {}
+
+    for i, entity in enumerate(all_entities):
+        columns['x'][i] = entity.x
+        columns['y'][i] = entity.y
+        columns['char'][i] = ord(entity.char)
+        columns['color'][i] = entity.color
+        columns['blocks'][i] = entity.blocks
+        columns['render_order'][i] = entity.render_order.value
+        columns['location'][i] = ON_FLOOR if i < len(entities) else IN_INVENTORY
+        names.append(entity.name)
+
+        if entity.fighter:
+            columns['has_fighter'][i] = True
+            columns['hp'][i] = entity.fighter.hp
+            columns['base_max_hp'][i] = entity.fighter.base_max_hp
+            columns['base_power'][i] = entity.fighter.base_power
+            columns['base_defense'][i] = entity.fighter.base_defense
+            columns['xp'][i] = entity.fighter.xp
+
+        ai = entity.ai
+
+        if ai:
+            columns['awake'][i] = ai.awake
+
+            if isinstance(ai, ConfusedMonster):
+                columns['ai'][i] = CONFUSED_AI
+                columns['confused_turns'][i] = ai.number_of_turns
+                ai = ai.previous_ai
+            else:
+                columns['ai'][i] = BASIC_AI
+
+            columns['patience'][i] = ai.patience
+            columns['turns_unseen'][i] = ai.turns_unseen
+
+        if entity.item:
+            columns['has_item'][i] = True
+            columns['targeting'][i] = entity.item.targeting
+
+            if entity.item.use_function or entity.item.targeting_message or entity.item.function_kwargs:
+                targeting_message = entity.item.targeting_message
+
+                item_kind = {
+                    'use_function': entity.item.use_function.__name__ if entity.item.use_function else None,
+                    'targeting_message': [targeting_message.text, list(targeting_message.color)]
+                    if targeting_message else None,
+                    'kwargs': dict(entity.item.function_kwargs)
+                }
+                key = json.dumps(item_kind, sort_keys=True)
+
+                if key not in item_kind_ids:
+                    item_kind_ids[key] = len(item_kinds)
+                    item_kinds.append(item_kind)
+
+                columns['item_kind'][i] = item_kind_ids[key]
+
+        if entity.equippable:
+            columns['equip_slot'][i] = entity.equippable.slot.value
+            columns['power_bonus'][i] = entity.equippable.power_bonus
+            columns['defense_bonus'][i] = entity.equippable.defense_bonus
+            columns['max_hp_bonus'][i] = entity.equippable.max_hp_bonus
+
+        if entity.stairs:
+            columns['stairs_floor'][i] = entity.stairs.floor
+
+    meta = {
+        'count': count,
+        'names': names,
+        'item_kinds': item_kinds
+    }
+
+    return columns, meta
+
+
+def restore_entities(columns, meta, store=None, player_index=None):
+    # Builds the entities back from their columns, returns (floor entities, inventory entities, all entities).
+    # With a store, the floor's monsters and items are spawned into it, as make_map does on floors that have one.
+    entities = []
+    inventory_items = []
+    all_entities = []
+
+    # Pull the columns out as Python lists once, indexing numpy arrays per element is slow
+    values = {name: column.tolist() for name, column in columns.items()}
+
+    if 'item_kinds' in meta:
+        item_kinds = [restore_item_kind(item_kind) for item_kind in meta['item_kinds']]
+    else:
+        # Version 2 saves keep the item data of every entity separately
+        item_kinds = []
+        values['item_kind'] = [-1] * meta['count']
+
+        for i, item_kind in meta['items'].items():
+            values['item_kind'][int(i)] = len(item_kinds)
+            item_kinds.append(restore_item_kind(item_kind))
+
+    for i in range(meta['count']):
+        fighter_component = None
+        ai_component = None
+        item_component = None
+        equippable_component = None
+        stairs_component = None
+
+        if values['has_fighter'][i]:
+            fighter_component = Fighter(hp=values['base_max_hp'][i], defense=values['base_defense'][i],
+                                        power=values['base_power'][i], xp=values['xp'][i])
+            fighter_component.hp = values['hp'][i]
+
+        if values['ai'][i] != NO_AI:
+            ai_component = BasicMonster(patience=values['patience'][i])
+            ai_component.awake = values['awake'][i]
+            ai_component.turns_unseen = values['turns_unseen'][i]
+
+            if values['ai'][i] == CONFUSED_AI:
+                ai_component = ConfusedMonster(ai_component, values['confused_turns'][i])
+
+        if values['has_item'][i]:
+            if values['item_kind'][i] >= 0:
+                item_component = copy(item_kinds[values['item_kind'][i]])
+            else:
+                item_component = Item()
+
+            item_component.targeting = values['targeting'][i]
+
+        if values['equip_slot'][i]:
+            equippable_component = Equippable(EquipmentSlots(values['equip_slot'][i]),
+                                              power_bonus=values['power_bonus'][i],
+                                              defense_bonus=values['defense_bonus'][i],
+                                              max_hp_bonus=values['max_hp_bonus'][i])
+
+        if values['stairs_floor'][i]:
+            stairs_component = Stairs(values['stairs_floor'][i])
+
+        entity = Entity(values['x'][i], values['y'][i], chr(values['char'][i]), tuple(values['color'][i]),
+                        meta['names'][i], blocks=values['blocks'][i],
+                        render_order=RenderOrder(values['render_order'][i]), fighter=fighter_component,
+                        ai=ai_component, item=item_component, stairs=stairs_component,
+                        equippable=equippable_component)
+
+        if (store is not None and values['location'][i] == ON_FLOOR and i != player_index and
+                not stairs_component):
+            # The restored entity is the template of its stored self
+            entity = store.spawn(entity, entity.x, entity.y)
+
+        if isinstance(entity.ai, ConfusedMonster):
+            entity.ai.previous_ai.owner = entity
+
+        all_entities.append(entity)
+
+        if values['location'][i] == ON_FLOOR:
+            entities.append(entity)
+        else:
+            inventory_items.append(entity)
+
+    return entities, inventory_items, all_entities
+
+
+def restore_item_kind(item_kind):
+    # A prototype Item that the items of this kind are copied from
+    use_function = getattr(item_functions, item_kind['use_function']) if item_kind['use_function'] else None
+    targeting_message = Message(item_kind['targeting_message'][0], tuple(item_kind['targeting_message'][1])) \
+        if item_kind['targeting_message'] else None
+
+    return Item(use_function=use_function, targeting_message=targeting_message, **item_kind['kwargs'])
+
+
+def snapshot_map(game_map):
+    # Only the chunks that exist are saved, with their keys
+    tile_keys, tile_chunks = game_map.tiles.to_chunks()
+    explored_keys, explored_chunks = game_map.explored.to_chunks()
+
+    arrays = {
+        'tile_keys': tile_keys,
+        'tile_chunks': tile_chunks,
+        'explored_keys': explored_keys,
+        'explored_chunks': explored_chunks
+    }
+
+    meta = {
+        'width': game_map.width,
+        'height': game_map.height,
+        'dungeon_level': game_map.dungeon_level,
+        'run_seed': game_map.streams.run_seed,
+        'ai_random': game_map.ai_random.getstate(),
+        'entity_storage': 'objects' if game_map.entity_store is None else 'columns'
+    }
+
+    return arrays, meta
+
+
+def restore_map(arrays, meta):
+    # Version 1 saves have no seed, they carry on with a fresh one
+    width, height = meta['width'], meta['height']
+    game_map = GameMap(width, height, meta['dungeon_level'], meta.get('run_seed'))
+
+    if 'tile_chunks' in arrays:
+        game_map.tiles = ChunkedGrid.from_chunks(width, height, np.uint8, tile_types.WALL, arrays['tile_keys'],
+                                                 arrays['tile_chunks'])
+        explored_chunks = arrays['explored_chunks']
+
+        if explored_chunks.dtype == np.bool_:
+            # Version 6 saves kept a byte per explored cell
+            explored_chunks = np.packbits(explored_chunks, axis=2)
+
+        game_map.explored = PackedChunkedGrid.from_chunks(width, height, np.bool_, False, arrays['explored_keys'],
+                                                          explored_chunks)
+    else:
+        # Version 5 and older saves hold the whole map as one array and the explored layer packed into bits
+        explored = PackedBoolGrid(width, height)
+        explored.bits[...] = arrays['explored']
+
+        game_map.tiles = ChunkedGrid.from_array(arrays['tiles'].reshape(width, height), tile_types.WALL)
+        game_map.explored = PackedChunkedGrid.from_array(explored.unpack(), False)
+
+    game_map.add_layers()
+    game_map.sync_tiles()
+
+    if 'ai_random' in meta:
+        version, internal_state, gauss_next = meta['ai_random']
+        game_map.ai_random.setstate((version, tuple(internal_state), gauss_next))
+
+    return game_map
+
+
+def snapshot_floor(game_map, entities, inventory_items=()):
+    # A floor on its own (map and the entities lying on it), as kept for floors the player isn't on
+    arrays, map_meta = snapshot_map(game_map)
+    columns, entity_meta = snapshot_entities(entities, inventory_items)
+
+    arrays.update({'entities.' + name: column for name, column in columns.items()})
+
+    entity_ids = {entity: i for i, entity in enumerate(entities)}
+    arrays['awake_order'] = np.array([entity_ids[entity] for entity in game_map.awake_entities
+                                      if entity in entity_ids], dtype=np.int32)
+
+    return {'meta': {'map': map_meta, 'entities': entity_meta}, 'arrays': arrays}
+
+
+def _restore_floor(snapshot):
+    meta = snapshot['meta']
+    arrays = snapshot['arrays']
+
+    game_map = restore_map(arrays, meta['map'])
+
+    # Saves made before floors recorded their storage mode kept plain entities
+    if meta['map'].get('entity_storage') == 'columns':
+        game_map.entity_store = EntityStore()
+
+    player_index = meta['player']['index'] if 'player' in meta else None
+
+    columns = {name[len('entities.'):]: column for name, column in arrays.items() if name.startswith('entities.')}
+    entities, _, all_entities = restore_entities(columns, meta['entities'], game_map.entity_store, player_index)
+
+    game_map.entity_index.rebuild(entities)
+
+    for index in arrays['awake_order'].tolist():
+        game_map.wake(entities[index])
+
+    return game_map, entities, all_entities
+
+
+def restore_floor(snapshot):
+    game_map, entities, _ = _restore_floor(snapshot)
+
+    return game_map, entities
+
+
+def snapshot_game(player, entities, game_map, message_log, game_state):
+    # The player's inventory isn't on the floor, it is stored after the floor entities
+    snapshot = snapshot_floor(game_map, entities, player.inventory.items)
+    meta = snapshot['meta']
+
+    inventory_ids = list(range(len(entities), len(entities) + len(player.inventory.items)))
+
+    meta['player'] = {
+        'index': entities.index(player),
+        'inventory_capacity': player.inventory.capacity,
+        'inventory': inventory_ids,
+        'equipped': [inventory_ids[player.inventory.items.index(equipped)]
+                     for equipped in player.equipment.slots.values() if equipped],
+        'level': [player.level.current_level, player.level.current_xp, player.level.level_up_base,
+                  player.level.level_up_factor]
+    }
+
+    meta['message_log'] = {
+        'x': message_log.x,
+        'width': message_log.width,
+        'height': message_log.height,
+        'capacity': message_log.history.maxlen,
+        'history': [[message.text, list(message.color)] for message in message_log.history]
+    }
+
+    meta['game_state'] = game_state.name
+
+    return snapshot
+
+
+def restore_game(snapshot):
+    meta = snapshot['meta']
+
+    game_map, entities, all_entities = _restore_floor(snapshot)
+
+    player_meta = meta['player']
+    player = entities[player_meta['index']]
+
+    player.inventory = Inventory(player_meta['inventory_capacity'])
+    player.inventory.owner = player
+    player.inventory.items = [all_entities[i] for i in player_meta['inventory']]
+
+    if 'equipped' in player_meta:
+        equipped = player_meta['equipped']
+    else:
+        # Version 3 saves had a main hand and an off hand entry
+        equipped = [player_meta[slot] for slot in ('main_hand', 'off_hand') if player_meta[slot] is not None]
+
+    player.equipment = Equipment([all_entities[i] for i in equipped])
+    player.equipment.owner = player
+    player.fighter.update_stats()
+
+    player.level = Level(*player_meta['level'])
+    player.level.owner = player
+
+    log_meta = meta['message_log']
+    message_log = MessageLog(log_meta['x'], log_meta['width'], log_meta['height'], log_meta.get('capacity', 1000))
+
+    # Version 4 saves only kept the wrapped lines on display
+    history = log_meta['history'] if 'history' in log_meta else log_meta['messages']
+    message_log.history.extend(Message(text, tuple(color)) for text, color in history)
+
+    game_state = GameStates[meta['game_state']]
+
+    return player, entities, game_map, message_log, game_state
+
+
+def encode_snapshot(snapshot, compress=True):
+    blocks = []
+    descriptions = []
+    offset = 0
+
+    for name, array in snapshot['arrays'].items():
+        array = np.ascontiguousarray(array)
+        data = array.tobytes()
+
+        if compress:
+            data = zlib.compress(data, 1)
+
+        descriptions.append({'name': name, 'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset,
+                             'size': len(data)})
+        blocks.append(data)
+        offset += len(data)
+
+    header = zlib.compress(json.dumps({'meta': snapshot['meta'], 'arrays': descriptions}).encode('utf-8'))
+    flags = FLAG_COMPRESSED if compress else 0
+
+    return b''.join([HEADER.pack(MAGIC, FORMAT_VERSION, flags, len(header)), header] + blocks)
+
+
+def decode_snapshot(data):
+    magic, version, flags, header_length = HEADER.unpack_from(data, 0)
+
+    if magic != MAGIC:
+        raise SaveFormatError('Not a save file')
+
+    if version > FORMAT_VERSION:
+        raise SaveFormatError(f'Save format version {version} is newer than this game supports ({FORMAT_VERSION})')
+
+    header = json.loads(zlib.decompress(data[HEADER.size:HEADER.size + header_length]).decode('utf-8'))
+    data_start = HEADER.size + header_length
+
+    arrays = {}
+
+    for description in header['arrays']:
+        start = data_start + description['offset']
+        block = data[start:start + description['size']]
+
+        if flags & FLAG_COMPRESSED:
+            block = zlib.decompress(block)
+
+        arrays[description['name']] = np.frombuffer(block, dtype=np.dtype(description['dtype'])).reshape(
+            description['shape'])
+
+    return {'meta': header['meta'], 'arrays': arrays}
+
+
+def write_snapshot(snapshot, path, compress=True):
+    # Write to a temporary file and rename it over the old save, so a crash never leaves half a save behind
+    data = encode_snapshot(snapshot, compress)
+    descriptor, temporary_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.',
+                                                  dir=os.path.dirname(path) or '.')
+
+    try:
+        with os.fdopen(descriptor, 'wb') as save_file:
+            save_file.write(data)
+            save_file.flush()
+            os.fsync(save_file.fileno())
+
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+def read_snapshot(path):
+    with open(path, 'rb') as save_file:
+        return decode_snapshot(save_file.read())
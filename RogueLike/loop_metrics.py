@@ -0,0 +1,43 @@
+import time
+
+
+class LoopMetrics:
+    '''
+    Frame rate and idle CPU use of the main loop. Time spent waiting for input is idle, the process CPU time used
+    while waiting shows whether the loop really sleeps or still spins.
+    '''
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.frames = 0
+        self.idle_time = 0.0
+        self.idle_cpu_time = 0.0
+
+        self.idle_started = None
+        self.idle_cpu_started = None
+
+    def frame(self):
+        self.frames += 1
+
+    def idle_start(self):
+        self.idle_started = time.perf_counter()
+        self.idle_cpu_started = time.process_time()
+
+    def idle_end(self):
+        self.idle_time += time.perf_counter() - self.idle_started
+        self.idle_cpu_time += time.process_time() - self.idle_cpu_started
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+
+        return {
+            'frames': self.frames,
+            'fps': self.frames / elapsed if elapsed else 0.0,
+            'idle_fraction': self.idle_time / elapsed if elapsed else 0.0,
+            'idle_cpu_percent': 100 * self.idle_cpu_time / self.idle_time if self.idle_time else 0.0
+        }
+
+    def report(self):
+        summary = self.summary()
+
+        return (f"{summary['frames']} frames, {summary['fps']:.1f} fps, {100 * summary['idle_fraction']:.0f}% idle "
+                f"at {summary['idle_cpu_percent']:.1f}% CPU")
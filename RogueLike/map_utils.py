@@ -1,26 +1,200 @@
-from tdl.map import Map
+from itertools import islice
+
+import numpy as np
 
-from random import randint
+from tdl.map import Map
 
-from components.ai import BasicMonster
-from components.equipment import EquipmentSlots
-from components.equippable import  Equippable
-from components.fighter import Fighter
-from components.item import Item
+from chunked_grid import ChunkedGrid, PackedChunkedGrid
 from components.stairs import Stairs
 from entity import Entity
+from entity_store import create_store
+from flow_field import FlowField
+from fov import FieldOfView, FovCache
 from game_messages import Message
-from item_functions import cast_confuse, cast_fireball, cast_lightning, heal
-from random_utils import from_dungeon_level, random_choice_from_dict
+from packed_grid import PackedBoolGrid
+from profiling import profiled
+from random_utils import RandomStreams
 from render_functions import RenderOrder
-
-class GameMap(Map):
-    def __init__(self, width, height, dungeon_level=1):
-        super().__init__(width, height)
-        self.explored = [[False for y in range(height)] for x in range(width)]
+from spatial_index import SpatialIndex
+import tile_types
+
+# Paths are searched within the rectangle spanning both ends, grown by this much on every side
+PATH_MARGIN = 32
+
+class TileLayer:
+    '''
+    A property of every tile looked up from the tile ids, indexed like the map.
+    '''
+    def __init__(self, tiles, table):
+        self.tiles = tiles
+        self.table = table
+
+    @property
+    def shape(self):
+        return self.tiles.shape
+
+    def __getitem__(self, position):
+        return self.table[self.tiles[position]]
+
+    def window(self, x1, y1, x2, y2):
+        return self.table[self.tiles.window(x1, y1, x2, y2)]
+
+class GameMap:
+    '''
+    One floor. Tiles and what has been explored are kept in chunks, only allocated where something was carved or
+    seen, and walkable and transparent are looked up from the tile ids, so memory grows with the dungeon and not
+    with the size of the map.
+    '''
+    # Bumped whenever tiles change, so cached results built from them can tell they are stale
+    version = 0
+    # Only bumped when a tile's transparency changes, fields of view stay valid across any other change
+    transparency_version = 0
+
+    flow_field = None
+    fov_cache = None
+    # Maps saved before entities could be stored in columns have none
+    entity_store = None
+
+    def __init__(self, width, height, dungeon_level=1, run_seed=None, entity_store=None):
+        self.width = width
+        self.height = height
+
+        self.tiles = ChunkedGrid(width, height, np.uint8, tile_types.WALL)
+        self.explored = PackedChunkedGrid(width, height)
+        self.fov = FieldOfView(width, height)
+        self.add_layers()
 
         self.dungeon_level = dungeon_level
 
+        self.streams = RandomStreams(run_seed)
+        # Monster behaviour on this floor draws from its own stream, saved along with the floor
+        self.ai_random = self.streams.stream('ai', dungeon_level)
+
+        self.entity_index = SpatialIndex()
+
+        # Column storage new monsters and items are spawned into, None when entities are plain objects
+        self.entity_store = entity_store
+
+        # Monsters whose AI is awake, in the order they woke up. A dict is used as an ordered set.
+        self.awake_entities = {}
+
+    def add_layers(self):
+        self.walkable = TileLayer(self.tiles, tile_types.WALKABLE)
+        self.transparent = TileLayer(self.tiles, tile_types.TRANSPARENT)
+
+    def set_tiles(self, x, y, tile):
+        # x and y may be ints or slices, so whole rooms and tunnels are carved in one assignment
+        if (self.transparent[x, y] != tile_types.TRANSPARENT[tile]).any():
+            self.transparency_version += 1
+
+        self.tiles[x, y] = tile
+        self.version += 1
+
+    def sync_tiles(self):
+        # Called after the tile ids were replaced wholesale
+        self.version += 1
+        self.transparency_version += 1
+
+    def compute_path(self, start_x, start_y, dest_x, dest_y):
+        # A* on a tdl map of the area around both ends, returns the steps after the start in map coordinates
+        x1 = max(min(start_x, dest_x) - PATH_MARGIN, 0)
+        y1 = max(min(start_y, dest_y) - PATH_MARGIN, 0)
+        x2 = min(max(start_x, dest_x) + PATH_MARGIN + 1, self.width)
+        y2 = min(max(start_y, dest_y) + PATH_MARGIN + 1, self.height)
+
+        area = Map(x2 - x1, y2 - y1)
+        area.walkable[:] = self.walkable.window(x1, y1, x2, y2)
+
+        return [(x + x1, y + y1) for x, y in area.compute_path(start_x - x1, start_y - y1, dest_x - x1, dest_y - y1)]
+
+    def flow_field_to(self, x, y):
+        # Every monster chasing the same target during a turn shares one distance field
+        flow_field = self.flow_field
+
+        if flow_field is None or (flow_field.target_x, flow_field.target_y, flow_field.version) != (x, y, self.version):
+            self.flow_field = FlowField(self.walkable, x, y, self.version)
+
+        return self.flow_field
+
+    def update_fov(self, x, y, engine, radius, light_walls):
+        # Fields already computed on this map are reused until a tile's transparency changes
+        if self.fov_cache is None:
+            self.fov_cache = FovCache()
+
+        field = self.fov_cache.get(self.transparency_version, (x, y, radius, light_walls, engine.name),
+                                   lambda: engine.compute(self, x, y, radius, light_walls))
+        self.fov.set(*field)
+
+    def __getstate__(self):
+        # The flow field and fields of view are cheap to rebuild and the layers are views of the tiles, keep them
+        # out of save files
+        state = dict(vars(self))
+
+        for name in ('flow_field', 'fov_cache', 'walkable', 'transparent'):
+            state.pop(name, None)
+
+        return state
+
+    def __setstate__(self, state):
+        if not isinstance(state.get('tiles'), ChunkedGrid):
+            state = restore_dense_layers(dict(state))
+
+        vars(self).update(state)
+        self.add_layers()
+
+    def wake(self, entity):
+        if entity.ai:
+            entity.ai.awake = True
+            self.awake_entities[entity] = None
+
+    def wake_entities_near(self, x, y, radius):
+        for entity in self.entity_index.entities_within(x, y, radius):
+            if entity.ai and not entity.ai.awake:
+                self.wake(entity)
+
+    def wake_visible_entities(self, x, y, radius):
+        for entity in self.entity_index.entities_within(x, y, radius):
+            if entity.ai and not entity.ai.awake and self.fov[entity.x, entity.y]:
+                self.wake(entity)
+
+    def add_entity(self, entities, entity):
+        entities.append(entity)
+        self.entity_index.add(entity)
+
+    def remove_entity(self, entities, entity):
+        entities.remove(entity)
+        self.entity_index.remove(entity)
+        self.awake_entities.pop(entity, None)
+
+def restore_dense_layers(state):
+    # Maps pickled while GameMap was a tdl map kept every layer as a full array. tcod's buffer holds the
+    # transparent, walkable and fov layers, indexed [y, x, layer].
+    buffer = state.pop('_buffer', None)
+
+    if buffer is None:
+        buffer = state.pop('_Map__buffer', None)
+
+    state.pop('_order', None)
+
+    tiles = state.get('tiles')
+
+    if tiles is None:
+        # Saves made before the map kept tile ids
+        tiles = np.where(buffer[:, :, 1].T, tile_types.FLOOR, tile_types.WALL).astype(np.uint8)
+
+    explored = state.get('explored')
+
+    if isinstance(explored, PackedBoolGrid):
+        explored = explored.unpack()
+    else:
+        explored = np.array(explored, dtype=np.bool_)
+
+    state['tiles'] = ChunkedGrid.from_array(tiles, tile_types.WALL)
+    state['explored'] = PackedChunkedGrid.from_array(explored, False)
+    state['fov'] = FieldOfView(state['width'], state['height'])
+
+    return state
+
 class Rect:
     def __init__(self, x, y, w, h):
         self.x1= x
@@ -38,179 +212,208 @@ class Rect:
         return (self.x1 <= other.x2 and self.x2 >= other.x1 and
                 self.y1 <= other.y2 and self.y2 >= other.y1)
 
+class RoomBuckets:
+    '''
+    Rooms filed under every cell of a coarse grid they touch, so a new room is only checked for overlaps against
+    the rooms near it.
+    '''
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def span(self, room):
+        size = self.cell_size
+
+        for cx in range(room.x1 // size, room.x2 // size + 1):
+            for cy in range(room.y1 // size, room.y2 // size + 1):
+                yield cx, cy
+
+    def add(self, room):
+        for cell in self.span(room):
+            self.cells.setdefault(cell, []).append(room)
+
+    def intersects(self, room):
+        return any(room.intersect(other) for cell in self.span(room) for other in self.cells.get(cell, ()))
+
+def scattered_rooms(rng, max_rooms, room_min_size, room_max_size, map_width, map_height):
+    # Rooms of random size at random places, any that overlaps an earlier one is dropped
+    buckets = RoomBuckets(room_max_size + 1)
+
+    for r in range(max_rooms):
+        # random width and height
+        w = rng.randint(room_min_size, room_max_size)
+        h = rng.randint(room_min_size, room_max_size)
+        # random position withut going outside bounds of the map
+        x = rng.randint(0, map_width - w - 1)
+        y = rng.randint(0, map_height - h - 1)
+
+        # "Rect" class makes rectangles easier to work with
+        new_room = Rect(x, y, w, h)
+
+        if not buckets.intersects(new_room):
+            buckets.add(new_room)
+            yield new_room
+
+def partitioned_rooms(rng, max_rooms, room_min_size, room_max_size, map_width, map_height):
+    # Splits the map in two over and over until every part fits the largest room, then puts a room in up to
+    # max_rooms of the parts, picked at random across the whole map. The parts don't overlap so neither do the
+    # rooms, and they come out in the order of the split, each near the one before.
+    smallest = room_min_size + 1
+    largest = room_max_size + 1
+
+    parts = [(0, 0, map_width, map_height)]
+    leaves = []
+
+    while parts:
+        x, y, w, h = parts.pop()
+
+        split_x = w > largest and w >= 2 * smallest
+        split_y = h > largest and h >= 2 * smallest
+
+        if split_x and (w >= h or not split_y):
+            split = rng.randint(smallest, w - smallest)
+            parts.append((x + split, y, w - split, h))
+            parts.append((x, y, split, h))
+        elif split_y:
+            split = rng.randint(smallest, h - smallest)
+            parts.append((x, y + split, w, h - split))
+            parts.append((x, y, w, split))
+        elif w >= smallest and h >= smallest:
+            leaves.append((x, y, w, h))
+
+    if len(leaves) > max_rooms:
+        leaves = [leaves[i] for i in sorted(rng.sample(range(len(leaves)), max_rooms))]
+
+    for x, y, w, h in leaves:
+        # The room's walls stay inside the part
+        room_w = rng.randint(room_min_size, min(room_max_size, w - 1))
+        room_h = rng.randint(room_min_size, min(room_max_size, h - 1))
+
+        yield Rect(rng.randint(x, x + w - 1 - room_w), rng.randint(y, y + h - 1 - room_h), room_w, room_h)
+
+# How make_map lays out the rooms of a floor, chosen by the map_generator constant
+ROOM_GENERATORS = {
+    'ROOMS': scattered_rooms,
+    'BSP': partitioned_rooms
+}
+
 def create_room(game_map, room):
-    # go through the tiles in the rectangle and make them passable
-    for x in range(room.x1 + 1, room.x2):
-        for y in range(room.y1 + 1, room.y2):
-            game_map.walkable[x, y] = True
-            game_map.transparent[x, y] = True
+    # make the tiles inside the rectangle passable
+    game_map.set_tiles(slice(room.x1 + 1, room.x2), slice(room.y1 + 1, room.y2), tile_types.FLOOR)
 
 def create_h_tunnel(game_map, x1, x2, y):
-    for x in range(min(x1,x2), max(x1,x2) + 1):
-        game_map.walkable[x,y] = True
-        game_map.transparent[x,y] = True
+    game_map.set_tiles(slice(min(x1, x2), max(x1, x2) + 1), y, tile_types.FLOOR)
 
 def create_v_tunnel(game_map, y1, y2, x):
-    for y in range(min(y1,y2), max(y1,y2) + 1):
-        game_map.walkable[x,y] = True
-        game_map.transparent[x,y] = True
-
-def place_entities(room, entities, dungeon_level, colors):
-    max_monsters_per_room = from_dungeon_level([[2, 1], [3, 4], [5, 6]], dungeon_level)
-    max_items_per_room = from_dungeon_level([[1, 1], [2, 4]], dungeon_level)
-    # Get a random number of monsters
-    number_of_monsters = randint(0, max_monsters_per_room)
-    number_of_items = randint(0, max_items_per_room)
-
-    monster_chances = {
-        'orc': 80,
-        'troll': from_dungeon_level([[15, 3], [30, 5], [60, 7]], dungeon_level)
-    }
-
-    item_chances = {
-        'heal_potion': 35,
-        'sword': from_dungeon_level([[5, 4]], dungeon_level),
-        'shield': from_dungeon_level([[15, 8]], dungeon_level),
-        'cast_lightning': from_dungeon_level([[25, 4]], dungeon_level),
-        'cast_fireball': from_dungeon_level([[25, 6]], dungeon_level),
-        'cast_confuse': from_dungeon_level([[10, 2]], dungeon_level)
-    }
-
-    for i in range(number_of_monsters):
-        # Choose a random location in the room
-        x = randint(room.x1 + 1, room.x2 - 1)
-        y = randint(room.y1 + 1, room.y2 - 1)
+    game_map.set_tiles(x, slice(min(y1, y2), max(y1, y2) + 1), tile_types.FLOOR)
 
-        if not any([entity for entity in entities if entity.x == x and entity.y == y]):
-            monster_choice = random_choice_from_dict(monster_chances)
+def populate_rooms(game_map, rooms, entities, templates, rng):
+    table = templates.spawn_table(game_map.dungeon_level)
 
-            if monster_choice == 'orc':
-                fighter_component = Fighter(hp=20, defense=0, power=4, xp=35)
-                ai_component = BasicMonster()
-                monster = Entity(x,y, 'o', colors.get('desaturated_green'), 'Orc', blocks=True,
-                                     render_order=RenderOrder.ACTOR, fighter=fighter_component, ai=ai_component)
+    # Get a random number of monsters and items for every room, then pick them all for the floor at once
+    monster_counts = [rng.randint(0, table.max_monsters_per_room) for room in rooms]
+    item_counts = [rng.randint(0, table.max_items_per_room) for room in rooms]
 
-            else:
-                fighter_component = Fighter(hp=30, defense=2, power=8, xp=100)
-                ai_component = BasicMonster()
-                monster = Entity(x,y, 'T', colors.get('darker_green'), 'Troll', blocks=True,
-                                     render_order=RenderOrder.ACTOR, fighter=fighter_component, ai=ai_component)
-
-            entities.append(monster)
-
-    for i in range(number_of_items):
-        x = randint(room.x1 + 1, room.x2 - 1)
-        y = randint(room.y1 + 1, room.y2 - 1)
-
-        if not any([entity for entity in entities if entity.x == x and entity.y == y]):
-            item_choice = random_choice_from_dict(item_chances)
-
-            if item_choice == 'heal_potion':
-                item_component = Item(use_function=heal, amount=40)
-                item = Entity(x, y, '!', colors.get('violet'), 'Healing Potion', render_order=RenderOrder.ITEM,
-                    item=item_component)
-            elif item_choice == 'sword':
-                equippable_component = Equippable(EquipmentSlots.MAIN_HAND, power_bonus=3)
-                item = Entity(x, y, '/', colors.get('sky'), 'Sword', equippable=equippable_component)
-            elif item_choice == 'shield':
-                equippable_component = Equippable(EquipmentSlots.OFF_HAND, defense_bonus=1)
-                item = Entity(x, y, '[', colors.get('darker_orange'), 'Shield', equippable=equippable_component)
-            elif item_choice == 'cast_fireball':
-                item_component = Item(use_function=cast_fireball, targeting=True, targeting_message=Message(
-                    'Left-click a target enemy to cast the spell, or right-click to cancel.', colors.get('light_cyan')),
-                                      damage=25, radius=3)
-                item = Entity(x, y, '#', colors.get('red'), 'Fireball Scroll', render_order=RenderOrder.ITEM,
-                              item=item_component)
-            elif item_choice == 'cast_confuse':
-                item_component = Item(use_function=cast_confuse, targeting=True, targeting_message=Message(
-                    'Left-click an error to confuse it with an error, or right-click to cancel.', colors.get('light_cyan')))
-                item = Entity(x, y, '#', colors.get('light_pink'), 'Confusion Scroll', render_order=RenderOrder.ITEM,
-                              item=item_component)
+    monster_choices = iter(table.monsters.draw_many(rng, sum(monster_counts)))
+    item_choices = iter(table.items.draw_many(rng, sum(item_counts)))
 
-            else:
-                item_component = Item(use_function=cast_lightning, damage=40, maximum_range=5)
-                item = Entity(x, y, "#", colors.get('yellow'), 'Lightning Scroll', render_order=RenderOrder.ITEM,
-                    item=item_component)
+    for room, number_of_monsters, number_of_items in zip(rooms, monster_counts, item_counts):
+        place_entities(game_map, room, entities, templates, rng, list(islice(monster_choices, number_of_monsters)),
+                       list(islice(item_choices, number_of_items)))
 
-            entities.append(item)
+@profiled('place_entities')
+def place_entities(game_map, room, entities, templates, rng, monster_choices, item_choices):
+    for choice in monster_choices + item_choices:
+        # Choose a random location in the room
+        x = rng.randint(room.x1 + 1, room.x2 - 1)
+        y = rng.randint(room.y1 + 1, room.y2 - 1)
 
+        if not game_map.entity_index.entities_at(x, y):
+            game_map.add_entity(entities, templates.spawn(choice, x, y, game_map.entity_store))
+
+@profiled('make_map')
 def make_map(game_map, max_rooms, room_min_size, room_max_size, map_width, map_height, player, entities,
-             colors):
+             templates, generator='ROOMS'):
     rooms = []
     num_rooms = 0
 
     center_of_last_room_x = None
     center_of_last_room_y = None
 
-    for r in range(max_rooms):
-        # random width and height
-        w = randint(room_min_size, room_max_size)
-        h = randint(room_min_size, room_max_size)
-        # random position withut going outside bounds of the map
-        x = randint(0, map_width - w - 1)
-        y = randint(0, map_height - h - 1)
+    # The layout and what spawns in it draw from separate streams, so changing one doesn't reshuffle the other
+    layout_random = game_map.streams.stream('layout', game_map.dungeon_level)
+    spawn_random = game_map.streams.stream('spawns', game_map.dungeon_level)
 
-        # "Rect" class makes rectangles easier to work with
-        new_room = Rect(x, y, w, h)
+    # The generator draws from the layout stream as it goes, so rooms are taken from it one at a time
+    new_rooms = ROOM_GENERATORS[generator](layout_random, max_rooms, room_min_size, room_max_size, map_width,
+                                           map_height)
 
-        # run through other rooms and see if intersection occurs
-        for other_room in rooms:
-            if new_room.intersect(other_room):
-                break
-        else:
-            # no intersections
+    for new_room in new_rooms:
+        # 'paint' to map's tiles
+        create_room(game_map, new_room)
+
+        # center coordinates of new room
+        (new_x, new_y) = new_room.center()
+
+        center_of_last_room_x = new_x
+        center_of_last_room_y = new_y
 
-            # 'paint' to map's tiles
-            create_room(game_map, new_room)
+        if num_rooms==0:
+            #this is the first room, where the player starts
+            player.x = new_x
+            player.y = new_y
+            game_map.entity_index.add(player)
 
-            # center coordinates of new room
-            (new_x, new_y) = new_room.center()
+            if game_map.dungeon_level > 1:
+                # the way back up is where the player arrives
+                up_stairs = Entity(new_x, new_y, '<', (255, 255, 255), 'Stairs up',
+                                   render_order=RenderOrder.STAIRS, stairs=Stairs(game_map.dungeon_level - 1))
+                game_map.add_entity(entities, up_stairs)
+        else:
+            # all rooms after first
+            # connect to previous room with tunnel
 
-            center_of_last_room_x = new_x
-            center_of_last_room_y = new_y
+            # center coordinates of previous room
+            (prev_x, prev_y) = rooms[num_rooms-1].center()
 
-            if num_rooms==0:
-                #this is the first room, where the player starts
-                player.x = new_x
-                player.y = new_y
+            # flip a coin (random number that is either 0 or 1)
+            if layout_random.randint(0,1) == 1:
+                # first move horizontally, then vertically
+                create_h_tunnel(game_map, prev_x, new_x, prev_y)
+                create_v_tunnel(game_map, prev_y, new_y, new_x)
             else:
-                # all rooms after first
-                # connect to previous room with tunnel
-
-                # center coordinates of previous room
-                (prev_x, prev_y) = rooms[num_rooms-1].center()
-
-                # flip a coin (random number that is either 0 or 1)
-                if randint(0,1) == 1:
-                    # first move horizontally, then vertically
-                    create_h_tunnel(game_map, prev_x, new_x, prev_y)
-                    create_v_tunnel(game_map, prev_y, new_y, new_x)
-                else:
-                    # first move vertically, then horizontally
-                    create_v_tunnel(game_map, prev_y, new_y, prev_x)
-                    create_h_tunnel(game_map, prev_x, new_x, new_y)
-
-            place_entities(new_room, entities, game_map.dungeon_level, colors)
-
-            #finally, append new room to the list
-            rooms.append(new_room)
-            num_rooms += 1
+                # first move vertically, then horizontally
+                create_v_tunnel(game_map, prev_y, new_y, prev_x)
+                create_h_tunnel(game_map, prev_x, new_x, new_y)
+
+        #finally, append new room to the list
+        rooms.append(new_room)
+        num_rooms += 1
+
+    populate_rooms(game_map, rooms, entities, templates, spawn_random)
+
     stairs_component = Stairs(game_map.dungeon_level + 1)
     down_stairs = Entity(center_of_last_room_x, center_of_last_room_y, '>', (255, 255, 255), 'Stairs',
                          render_order=RenderOrder.STAIRS, stairs=stairs_component)
-    entities.append(down_stairs)
+    game_map.add_entity(entities, down_stairs)
 
-def next_floor(player, message_log, dungeon_level, constants):
-    game_map = GameMap(constants['map_width'], constants['map_height'], dungeon_level)
+@profiled('next_floor')
+def next_floor(player, message_log, dungeon_level, constants, run_seed):
+    game_map = GameMap(constants['map_width'], constants['map_height'], dungeon_level, run_seed,
+                       create_store(constants))
     entities = [player]
 
     make_map(game_map, constants['max_rooms'], constants['room_min_size'],
              constants['room_max_size'], constants['map_width'], constants['map_height'], player, entities,
-             constants['colors'])
+             constants['entity_templates'], constants['map_generator'])
+
+    rest(player, message_log, constants)
 
+    return game_map, entities
+
+def rest(player, message_log, constants):
+    # Reaching a new floor gives the player a breather
     player.fighter.heal(player.fighter.max_hp // 2)
 
     message_log.add_message(Message('You take a moment to rest, and recover your strength.',
                                     constants['colors'].get('light_violet')))
-
-    return game_map, entities
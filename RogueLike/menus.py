@@ -1,11 +1,46 @@
 import tdl
 
 import textwrap
+from collections import OrderedDict
 
 
+class OverlayCache:
+    '''
+    Off-screen consoles of the menus and screens drawn so far, keyed by everything that goes into them, so an
+    overlay that hasn't changed is blitted again instead of rebuilt. Past capacity the least recently used is dropped.
+    '''
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.consoles = OrderedDict()
+
+    def get(self, key, build):
+        window = self.consoles.get(key)
+
+        if window is None:
+            window = build()
+            self.consoles[key] = window
+
+            if len(self.consoles) > self.capacity:
+                self.consoles.popitem(last=False)
+        else:
+            self.consoles.move_to_end(key)
+
+        return window
+
+overlay_cache = OverlayCache(16)
+
 def menu(con, root, header, options, width, screen_width, screen_height):
     if len(options) > 26: raise ValueError('Cannot have a menu with more than 26 options.')
 
+    window = overlay_cache.get(('menu', header, tuple(options), width), lambda: build_menu(header, options, width))
+    height = window.height
+
+    # blit the contents of "window" to the root console
+    x = screen_width // 2 - width // 2
+    y = screen_height // 2 - height // 2
+    root.blit(window, x, y, width, height, 0, 0)
+
+def build_menu(header, options, width):
     # calculate total height for the header (after textwrap) and one line per option
     header_wrapped = textwrap.wrap(header, width)
     header_height = len(header_wrapped)
@@ -27,10 +62,7 @@ def menu(con, root, header, options, width, screen_width, screen_height):
         y += 1
         letter_index += 1
 
-    # blit the contents of "window" to the root console
-    x = screen_width // 2 - width // 2
-    y = screen_height // 2 - height // 2
-    root.blit(window, x, y, width, height, 0, 0)
+    return window
 
 def inventory_menu(con, root, header, player, inventory_width, screen_width, screen_height):
     # show a menu with each item of the inventory as an option
@@ -40,27 +72,36 @@ def inventory_menu(con, root, header, player, inventory_width, screen_width, scr
         options = []
 
         for item in player.inventory.items:
-            if player.equipment.main_hand == item:
-                options.append(f'{item.name} (on main hand)')
-            elif player.equipment.off_hand == item:
-                options.append(f'{item.name} (on off hand)')
+            slot = player.equipment.slot_of(item)
+
+            if slot:
+                options.append(f'{item.name} (on {slot.label})')
             else:
                 options.append(item.name)
 
     menu(con, root, header, options, inventory_width, screen_width, screen_height)
 
 def main_menu(con, root_console, background_image, screen_width, screen_height, colors):
-    background_image.blit_2x(root_console, 0, 0)
+    background = overlay_cache.get(('main_menu', id(background_image), screen_width, screen_height),
+                                   lambda: build_main_menu(background_image, screen_width, screen_height, colors))
+    root_console.blit(background, 0, 0, screen_width, screen_height, 0, 0)
+
+    menu(con, root_console, '', ['Play a new game', 'Continue last game', 'Quit'], 24, screen_width, screen_height)
+
+def build_main_menu(background_image, screen_width, screen_height, colors):
+    window = tdl.Console(screen_width, screen_height)
+
+    background_image.blit_2x(window, 0, 0)
 
     title = 'DUNGEONS OF DOOM'
     center = (screen_width - len(title)) // 2
-    root_console.draw_str(center, screen_height // 2 - 4, title, bg=None, fg=colors.get('white'))
+    window.draw_str(center, screen_height // 2 - 4, title, bg=None, fg=colors.get('white'))
 
     title = 'By the Best Boys K-State'
     center = (screen_width - len(title)) // 2
-    root_console.draw_str(center, screen_height - 2, title, bg=None, fg=colors.get('white'))
+    window.draw_str(center, screen_height - 2, title, bg=None, fg=colors.get('white'))
 
-    menu(con, root_console, '', ['Play a new game', 'Continue last game', 'Quit'], 24, screen_width, screen_height)
+    return window
 
 def level_up_menu(con, root, header, player, menu_width, screen_width, screen_height):
     options = [f'Constitution (+20 HP, from {player.fighter.max_hp})',
@@ -71,6 +112,19 @@ def level_up_menu(con, root, header, player, menu_width, screen_width, screen_he
 
 def character_screen(root_console, player, character_screen_width, character_screen_height, screen_width,
                      screen_height):
+    level = player.level
+    fighter = player.fighter
+
+    key = ('character_screen', level.current_level, level.current_xp, level.experience_to_next_level, fighter.max_hp,
+           fighter.power, fighter.defense, character_screen_width, character_screen_height)
+    window = overlay_cache.get(key, lambda: build_character_screen(player, character_screen_width,
+                                                                   character_screen_height))
+
+    x = screen_width // 2 - character_screen_width // 2
+    y = screen_height // 2 - character_screen_height // 2
+    root_console.blit(window, x, y, character_screen_width, character_screen_height, 0, 0)
+
+def build_character_screen(player, character_screen_width, character_screen_height):
     window = tdl.Console(character_screen_width, character_screen_height)
 
     window.draw_rect(0, 0, character_screen_width, character_screen_height, None, fg=(255, 255, 255), bg=None)
@@ -83,9 +137,29 @@ def character_screen(root_console, player, character_screen_width, character_scr
     window.draw_str(0, 7, f'Attack: {player.fighter.power}')
     window.draw_str(0, 8, f'Defense: {player.fighter.defense}')
 
-    x = screen_width // 2 - character_screen_width // 2
-    y = screen_height // 2 - character_screen_height // 2
-    root_console.blit(window, x, y, character_screen_width, character_screen_height, 0, 0)
+    return window
+
+def message_history(root_console, message_log, width, height, screen_width, screen_height, colors):
+    # Clamped before it goes into the key, scrolling past the top would otherwise cache the same page again
+    message_log.clamp_scroll(width, height - 1)
+    key = ('message_history', message_log.version, message_log.scroll_offset, width, height)
+    window = overlay_cache.get(key, lambda: build_message_history(message_log, width, height, colors))
+
+    x = screen_width // 2 - width // 2
+    y = screen_height // 2 - height // 2
+    root_console.blit(window, x, y, width, height, 0, 0)
+
+def build_message_history(message_log, width, height, colors):
+    window = tdl.Console(width, height)
+
+    window.draw_rect(0, 0, width, height, None, fg=colors.get('white'), bg=colors.get('black'))
+    window.draw_str(0, 0, 'Message history: arrows and page keys scroll, Esc closes')
+
+    # The first row is the title, the rest is history
+    for y, message in enumerate(message_log.scrollback(width, height - 1), 1):
+        window.draw_str(0, y, message.text, fg=message.color, bg=None)
+
+    return window
 
 def message_box(con, root_console, header, width, screen_width, screen_height):
     menu(con, root_console, header, [], width, screen_width, screen_height)
@@ -0,0 +1,40 @@
+import numpy as np
+
+
+class PackedBoolGrid:
+    '''
+    A width x height grid of booleans stored eight to a byte, indexed as grid[x, y].
+    '''
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.bits = np.zeros((width * height + 7) // 8, dtype=np.uint8)
+
+    def __getitem__(self, position):
+        x, y = position
+        index = x * self.height + y
+
+        return bool(self.bits[index >> 3] & (0x80 >> (index & 7)))
+
+    def __setitem__(self, position, value):
+        x, y = position
+        index = x * self.height + y
+
+        if value:
+            self.bits[index >> 3] |= 0x80 >> (index & 7)
+        else:
+            self.bits[index >> 3] &= ~(0x80 >> (index & 7)) & 0xff
+
+    def update(self, mask):
+        # Set every cell that is True in a (width, height) boolean array
+        self.bits |= np.packbits(mask)
+
+    def unpack(self):
+        return np.unpackbits(self.bits, count=self.width * self.height).reshape(self.width, self.height).astype(np.bool_)
+
+    @classmethod
+    def from_array(cls, mask):
+        grid = cls(*mask.shape)
+        grid.update(mask)
+
+        return grid
@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import nullcontext
+from functools import wraps
+
+import numpy as np
+
+# Set to a file name (or 1 for the default one) to profile the game and write a trace there on exit
+PROFILE_VARIABLE = 'ROGUELIKE_PROFILE'
+DEFAULT_TRACE_FILE = 'trace.json'
+
+# Durations kept per span for the summary, and spans kept for the trace
+SUMMARY_WINDOW = 1000
+TRACE_LIMIT = 1000000
+
+# Seconds between summaries printed while the game runs
+REPORT_INTERVAL = 10
+
+NO_SPAN = nullcontext()
+
+
+class Span:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns())
+
+
+class Profiler:
+    '''
+    Times named spans of the game loop. Keeps the latest durations of every span for a p50/p95/max summary and
+    every span as a Chrome trace event. While disabled a span is a shared no-op context manager.
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.trace_path = None
+        self.started = time.perf_counter_ns()
+        self.last_report = time.monotonic()
+
+        self.durations = defaultdict(lambda: deque(maxlen=SUMMARY_WINDOW))
+        self.events = deque(maxlen=TRACE_LIMIT)
+
+    def enable(self, trace_path=DEFAULT_TRACE_FILE):
+        self.enabled = True
+        self.trace_path = trace_path
+
+    def enable_from_environment(self):
+        trace_path = os.environ.get(PROFILE_VARIABLE)
+
+        if trace_path:
+            self.enable(DEFAULT_TRACE_FILE if trace_path == '1' else trace_path)
+
+    def span(self, name):
+        if not self.enabled:
+            return NO_SPAN
+
+        return Span(self, name)
+
+    def record(self, name, start, end):
+        # start and end are time.perf_counter_ns readings
+        self.durations[name].append(end - start)
+        self.events.append((name, start, end, threading.get_ident()))
+
+    def summary(self):
+        # Milliseconds per span over the latest SUMMARY_WINDOW of them
+        summary = {}
+
+        for name, durations in self.durations.items():
+            milliseconds = np.fromiter(durations, dtype=np.float64, count=len(durations)) / 1e6
+
+            summary[name] = {
+                'count': len(milliseconds),
+                'p50': float(np.percentile(milliseconds, 50)),
+                'p95': float(np.percentile(milliseconds, 95)),
+                'max': float(milliseconds.max())
+            }
+
+        return summary
+
+    def report(self):
+        lines = [f"{'span':<16}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}"]
+
+        for name, stats in sorted(self.summary().items()):
+            lines.append(f"{name:<16}{stats['count']:>8}{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['max']:>10.3f}")
+
+        return '\n'.join(lines)
+
+    def report_if_due(self):
+        if self.enabled and time.monotonic() - self.last_report >= REPORT_INTERVAL:
+            self.last_report = time.monotonic()
+            print(self.report())
+
+    def trace(self):
+        # Chrome's trace event format, timestamps in microseconds from when the profiler was created
+        pid = os.getpid()
+
+        return {
+            'traceEvents': [{'name': name, 'ph': 'X', 'ts': (start - self.started) / 1000,
+                             'dur': (end - start) / 1000, 'pid': pid, 'tid': tid}
+                            for name, start, end, tid in self.events],
+            'displayTimeUnit': 'ms'
+        }
+
+    def write_trace(self, path=None):
+        with open(path or self.trace_path, 'w') as trace_file:
+            json.dump(self.trace(), trace_file)
+
+    def finish(self):
+        # Print the summary and write the trace, if profiling was on
+        if self.enabled:
+            print(self.report())
+            self.write_trace()
+
+
+profiler = Profiler()
+
+
+def profiled(name):
+    # Times every call of the decorated function as a span, disabled it costs one attribute check
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+
+            with Span(profiler, name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
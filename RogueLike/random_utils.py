@@ -1,12 +1,88 @@
-from numpy.random import choice
+import hashlib
+import random
 
-def random_choice_from_dict(choice_dict):
-    choices = list(choice_dict.keys())
-    chances = list(choice_dict.values())
+import numpy as np
 
-    decimal_chances = [chance / sum(chances) for chance in chances]
 
-    return choice(choices, p=decimal_chances)
+class RandomStreams:
+    '''
+    Random number generators derived from one run seed. Every subsystem (layout, spawns, ai, combat) gets its own
+    stream on every floor, so a floor comes out the same whichever process builds it and whatever was generated
+    before it.
+    '''
+    def __init__(self, run_seed=None):
+        if run_seed is None:
+            run_seed = random.SystemRandom().getrandbits(63)
+
+        self.run_seed = run_seed
+
+    def seed_for(self, subsystem, dungeon_level):
+        key = f'{self.run_seed}:{subsystem}:{dungeon_level}'.encode()
+
+        return int.from_bytes(hashlib.sha256(key).digest()[:8], 'little')
+
+    def stream(self, subsystem, dungeon_level):
+        # A new generator at the start of the stream, the caller keeps it for as long as it draws from it
+        return random.Random(self.seed_for(subsystem, dungeon_level))
+
+
+class AliasTable:
+    '''
+    Weighted choice between the keys of a {choice: chance} dict, built once with Vose's alias method so every draw
+    costs two random numbers no matter how many choices there are.
+    '''
+    def __init__(self, choice_dict):
+        self.choices = [choice for choice, chance in choice_dict.items() if chance > 0]
+        chances = [choice_dict[choice] for choice in self.choices]
+
+        count = len(self.choices)
+        total = sum(chances)
+        scaled = [chance * count / total for chance in chances]
+
+        probability = [1.0] * count
+        alias = list(range(count))
+
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+
+            probability[less] = scaled[less]
+            alias[less] = more
+
+            scaled[more] -= 1 - scaled[less]
+
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+
+        # Whatever is left over is 1 up to rounding error
+        self.probability = probability
+        self.alias = alias
+
+        self.probability_array = np.array(probability)
+        self.alias_array = np.array(alias, dtype=np.intp)
+
+    def draw(self, rng):
+        column = int(rng.random() * len(self.choices))
+
+        if rng.random() < self.probability[column]:
+            return self.choices[column]
+
+        return self.choices[self.alias[column]]
+
+    def draw_many(self, rng, count):
+        # All the draws in one go. The numpy generator is seeded from rng, so the result still follows its stream.
+        generator = np.random.default_rng(rng.getrandbits(64))
+
+        columns = generator.integers(0, len(self.choices), count)
+        picked = np.where(generator.random(count) < self.probability_array[columns], columns,
+                          self.alias_array[columns])
+
+        return [self.choices[i] for i in picked.tolist()]
 
 def from_dungeon_level(table, dungeon_level):
     for (value, level) in reversed(table):
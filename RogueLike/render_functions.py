@@ -1,9 +1,18 @@
 from enum import Enum, auto
 
+import numpy as np
+import tcod.console
+
+from camera import Camera
 from game_states import GameStates
 
-from menus import character_screen, inventory_menu, level_up_menu
+from menus import character_screen, inventory_menu, level_up_menu, message_history
+from profiling import profiled
+from tile_types import tile_palettes
+
 
+# Above this many changed cells the map is redrawn from arrays in one go instead of cell by cell
+BULK_REDRAW_THRESHOLD = 64
 
 class RenderOrder(Enum):
     STAIRS = auto()
@@ -11,10 +20,9 @@ class RenderOrder(Enum):
     ITEM = auto()
     ACTOR = auto()
 
-def get_names_under_mouse(mouse_coordinates, entities, game_map):
-    x, y = mouse_coordinates
-    names = [entity.name for entity in entities
-                if entity.x == x and entity.y == y and game_map.fov[entity.x, entity.y]]
+def get_names_under_mouse(mouse_coordinates, entities, game_map, camera):
+    x, y = camera.to_map(*mouse_coordinates)
+    names = [entity.name for entity in game_map.entity_index.entities_at(x, y) if game_map.fov[x, y]]
     names = ', '.join(names)
     return names.capitalize()
 
@@ -33,32 +41,104 @@ def render_bar(panel, x, y, total_width, name, value, maximum, bar_color, back_c
 
     panel.draw_str(x_centered, y, text, fg=string_color, bg=None)
 
+class RenderState:
+    '''
+    What the last frame put on the map console and the panel, so the next frame only redraws what changed.
+    '''
+    def __init__(self):
+        # Tile colours as arrays for bulk redraws and as tuples for single cells, and numpy views of the map
+        # console's buffers, all made on the first frame
+        self.palettes = None
+        self.palette_tuples = None
+        self.buffers = None
+
+        # The part of the map on screen, made on the first frame to fit the space above the panel
+        self.camera = None
+
+        self.reset()
+
+    def reset(self):
+        # Forces a full redraw, needed whenever the consoles were cleared
+        self.visible = None
+        self.explored = None
+        self.entities = {}
+        self.hud = None
+
+@profiled('render_all')
 def render_all(con, panel, entities, player, game_map, fov_recompute, root_console, message_log, screen_width, screen_height,
-        bar_width, panel_height, panel_y, mouse_coordinates, colors, game_state):
-    # Draw all the tiles in the game map
-    if fov_recompute:
-        for x, y in game_map:
-            wall = not game_map.transparent[x, y]
+        bar_width, panel_height, panel_y, mouse_coordinates, colors, game_state, render_state):
+    dirty_tiles = set()
+
+    if render_state.camera is None:
+        render_state.camera = Camera(screen_width, panel_y)
+
+    camera = render_state.camera
+
+    # Everything below works in screen cells, only the part of the map the camera shows is looked at
+    if camera.follow(player.x, player.y, game_map.width, game_map.height):
+        # The whole view scrolled, every cell on screen shows another tile now
+        render_state.reset()
+        scrolled = True
+    else:
+        scrolled = False
+
+    # Tiles whose lit or explored state flipped since the last frame
+    if fov_recompute or render_state.visible is None:
+        fov = game_map.fov
+        game_map.explored.update(fov.x1, fov.y1, fov.window)
+
+        visible = fov.area(*camera.bounds)
+        explored = game_map.explored.window(*camera.bounds)
+
+        if scrolled:
+            changed = np.ones(visible.shape, dtype=np.bool_)
+        elif render_state.visible is None:
+            changed = explored
+        else:
+            changed = (visible != render_state.visible) | (explored != render_state.explored)
+
+        render_state.visible = visible
+        render_state.explored = explored
+        dirty_tiles.update(map(tuple, np.argwhere(changed).tolist()))
+
+    # Tiles where an entity moved, appeared, disappeared or changed its look
+    drawn_entities = {}
+
+    for entity in entities:
+        if not camera.shows(entity.x, entity.y):
+            continue
+
+        x, y = camera.to_screen(entity.x, entity.y)
 
-            if game_map.fov[x,y]:
-                if wall:
-                    con.draw_char(x, y, None, fg=None, bg=colors.get('light_wall'))
-                else:
-                    con.draw_char(x, y, None, fg=None, bg=colors.get('light_ground'))
+        if entity_is_visible(entity, x, y, render_state):
+            drawn = (x, y, entity.char, entity.color, entity.render_order)
+            drawn_entities[entity] = drawn
 
-                game_map.explored[x][y] = True
+            if render_state.entities.get(entity) != drawn:
+                dirty_tiles.add((x, y))
 
-            elif game_map.explored[x][y]:
-                if wall:
-                    con.draw_char(x, y, None, fg=None, bg=colors.get('dark_wall'))
-                else:
-                    con.draw_char(x, y, None, fg=None, bg=colors.get('dark_ground'))
+    for entity, drawn in render_state.entities.items():
+        if drawn_entities.get(entity) != drawn:
+            dirty_tiles.add((drawn[0], drawn[1]))
 
-    entities_in_render_order = sorted(entities, key=lambda x:x.render_order.value)
+    render_state.entities = drawn_entities
 
-    # Draw all entities in the list
-    for entity in entities_in_render_order:
-        draw_entity(con, entity, game_map)
+    if render_state.palettes is None:
+        render_state.palettes = tile_palettes(colors)
+        render_state.palette_tuples = [[tuple(color) for color in palette.tolist()]
+                                       for palette in render_state.palettes]
+
+    if render_state.buffers is None:
+        # False when the console's cells can't be reached, every redraw is then done cell by cell
+        render_state.buffers = console_buffers(con) or False
+
+    if len(dirty_tiles) > BULK_REDRAW_THRESHOLD and render_state.buffers:
+        draw_map(game_map, render_state, colors)
+    else:
+        light, dark = render_state.palette_tuples
+
+        for x, y in dirty_tiles:
+            draw_tile(con, x, y, game_map, render_state, light, dark, colors)
 
     root_console.blit(con, 0, 0, screen_width, screen_height, 0, 0)
 
@@ -77,31 +157,98 @@ def render_all(con, panel, entities, player, game_map, fov_recompute, root_conso
     elif game_state == GameStates.CHARACTER_SCREEN:
         character_screen(root_console, player, 30, 10, screen_width, screen_height)
 
-    panel.clear(fg=colors.get('white'), bg=colors.get('black'))
+    elif game_state == GameStates.MESSAGE_HISTORY:
+        message_history(root_console, message_log, screen_width - 10, screen_height - 10, screen_width,
+                        screen_height, colors)
 
-    #Print the game messages, one line at a time
-    y = 1
-    for message in message_log.messages:
-        panel.draw_str(message_log.x, y, message.text, bg=None, fg=message.color)
-        y+=1
+    names_under_mouse = get_names_under_mouse(mouse_coordinates, entities, game_map, camera)
+    hud = (player.fighter.hp, player.fighter.max_hp, game_map.dungeon_level, message_log.version, names_under_mouse)
 
-    render_bar(panel, 1, 1, bar_width, 'HP', player.fighter.hp, player.fighter.max_hp,
-        colors.get('light_red'), colors.get('darker_red'), colors.get('white'))
+    if hud != render_state.hud:
+        render_state.hud = hud
 
-    panel.draw_str(1, 3, f'Dungeon Level: {game_map.dungeon_level}', fg=colors.get('white'), bg=None)
+        panel.clear(fg=colors.get('white'), bg=colors.get('black'))
 
-    panel.draw_str(1, 0, get_names_under_mouse(mouse_coordinates, entities, game_map))
+        #Print the game messages, one line at a time
+        y = 1
+        for message in message_log.messages:
+            panel.draw_str(message_log.x, y, message.text, bg=None, fg=message.color)
+            y+=1
 
-    root_console.blit(panel, 0, panel_y, screen_width, panel_height, 0, 0)
+        render_bar(panel, 1, 1, bar_width, 'HP', player.fighter.hp, player.fighter.max_hp,
+            colors.get('light_red'), colors.get('darker_red'), colors.get('white'))
 
-def clear_all(con, entities):
-    for entity in entities:
-        clear_entity(con, entity)
+        panel.draw_str(1, 3, f'Dungeon Level: {game_map.dungeon_level}', fg=colors.get('white'), bg=None)
+
+        panel.draw_str(1, 0, names_under_mouse)
 
-def draw_entity(con, entity, game_map):
-    if game_map.fov[entity.x, entity.y] or (entity.stairs and game_map.explored[entity.x][entity.y]):
-        con.draw_char(entity.x, entity.y, entity.char, entity.color, bg=None)
+    root_console.blit(panel, 0, panel_y, screen_width, panel_height, 0, 0)
 
-def clear_entity(con, entity):
-    # Erase character that represents this object
-    con.draw_char(entity.x, entity.y, ' ', entity.color, bg=None)
+def entity_is_visible(entity, x, y, render_state):
+    # x and y are the entity's cell on screen
+    return render_state.visible[x, y] or (entity.stairs and render_state.explored[x, y])
+
+def console_buffers(console):
+    # The console's character, foreground and background cells as numpy arrays indexed [x, y]. They share memory
+    # with the console, so writing to them draws. tcod only offers this through a private constructor, None is
+    # returned if it is gone or doesn't give back the console's cells.
+    from_cdata = getattr(tcod.console.Console, '_from_cdata', None)
+
+    try:
+        cells = from_cdata(console.console_c)
+    except (AttributeError, TypeError):
+        return None
+
+    if cells.ch.shape != (console.height, console.width):
+        return None
+
+    return cells.ch.T, cells.fg.transpose(1, 0, 2), cells.bg.transpose(1, 0, 2)
+
+def draw_map(game_map, render_state, colors):
+    # Every cell of the view at once: backgrounds looked up from the tile palettes through the FOV and explored
+    # masks, then the visible entities' glyphs on top
+    ch, fg, bg = render_state.buffers
+    light, dark = render_state.palettes
+    camera = render_state.camera
+    width, height = camera.width, camera.height
+
+    tiles = game_map.tiles.window(*camera.bounds)
+    visible = render_state.visible
+    remembered = render_state.explored & ~visible
+
+    ch[:width, :height] = ord(' ')
+
+    map_bg = bg[:width, :height]
+    map_bg[...] = colors.get('black')
+    map_bg[remembered] = dark[tiles[remembered]]
+    map_bg[visible] = light[tiles[visible]]
+
+    # One glyph per cell, on a shared cell the entity with the highest render order wins. Assigning to repeated
+    # indices in one go leaves it to numpy which write lands, so the cells are made unique first.
+    top = {}
+
+    for drawn in sorted(render_state.entities.values(), key=lambda drawn: drawn[4].value):
+        top[drawn[0], drawn[1]] = drawn
+
+    if top:
+        xs, ys, chars, entity_colors, _ = zip(*top.values())
+        ch[xs, ys] = [ord(char) for char in chars]
+        fg[xs, ys] = entity_colors
+
+def draw_tile(con, x, y, game_map, render_state, light, dark, colors):
+    # Redraw one screen cell: the background of the tile it shows, then whatever visible entities stand on it
+    map_x, map_y = render_state.camera.to_map(x, y)
+    tile = game_map.tiles[map_x, map_y]
+
+    if render_state.visible[x, y]:
+        con.draw_char(x, y, ' ', fg=None, bg=light[tile])
+    elif render_state.explored[x, y]:
+        con.draw_char(x, y, ' ', fg=None, bg=dark[tile])
+    else:
+        con.draw_char(x, y, ' ', fg=None, bg=colors.get('black'))
+
+    entities_on_tile = sorted(game_map.entity_index.entities_at(map_x, map_y), key=lambda x:x.render_order.value)
+
+    for entity in entities_on_tile:
+        if entity_is_visible(entity, x, y, render_state):
+            con.draw_char(x, y, entity.char, entity.color, bg=None)
@@ -0,0 +1,195 @@
+"""
+Headless batch simulation. Runs seeded games to completion with a scripted or random player and
+reports how many turns per second the game logic manages without a window.
+
+    python simulate.py --games 20 --seed 1 --player scripted
+"""
+
+import argparse
+import random
+import tempfile
+import time
+
+from dungeon import Dungeon, FloorPregenerator
+from game_states import GameStates
+from loader_functions.initialize_new_game import get_constants, get_game_variables
+from profiling import DEFAULT_TRACE_FILE, profiler
+from turn_logic import TurnState, step, update_fov
+
+DIRECTIONS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+
+class RandomPlayer:
+    def __init__(self, rng):
+        self.rng = rng
+
+    def next_action(self, state):
+        if state.game_state == GameStates.LEVEL_UP:
+            return {'level_up': self.rng.choice(['hp', 'str', 'def'])}
+        elif state.game_state != GameStates.PLAYERS_TURN:
+            return {'exit': True}
+
+        roll = self.rng.random()
+
+        if roll < 0.05:
+            return {'pickup': True}
+        elif roll < 0.1:
+            return {'take_stairs': True}
+
+        return {'move': self.rng.choice(DIRECTIONS)}
+
+
+class ScriptedPlayer:
+    '''
+    Fights whatever it can see, picks up items it stands on, drinks potions when hurt and
+    otherwise heads for the stairs.
+    '''
+    def __init__(self, rng):
+        self.rng = rng
+
+    def next_action(self, state):
+        player = state.player
+        game_map = state.game_map
+
+        if state.game_state == GameStates.LEVEL_UP:
+            return {'level_up': self.rng.choice(['hp', 'str', 'def'])}
+        elif state.game_state == GameStates.TARGETING:
+            target = self.nearest_visible_monster(state)
+
+            if target:
+                return {'left_click': (target.x, target.y)}
+
+            return {'right_click': (0, 0)}
+        elif state.game_state != GameStates.PLAYERS_TURN:
+            return {'exit': True}
+
+        if player.fighter.hp < player.fighter.max_hp // 3:
+            for index, item in enumerate(player.inventory.items):
+                if item.item.use_function and item.item.use_function.__name__ == 'heal':
+                    return {'show_inventory': True, 'inventory_index': index}
+
+        target = self.nearest_visible_monster(state)
+
+        if target:
+            if max(abs(target.x - player.x), abs(target.y - player.y)) <= 1:
+                return {'move': (target.x - player.x, target.y - player.y)}
+
+            return self.walk_towards(state, target.x, target.y)
+
+        for entity in game_map.entity_index.entities_at(player.x, player.y):
+            if entity.item and len(player.inventory.items) < player.inventory.capacity:
+                return {'pickup': True}
+            elif entity.stairs and entity.stairs.floor > game_map.dungeon_level:
+                return {'take_stairs': True}
+
+        for entity in state.entities:
+            if entity.stairs and entity.stairs.floor > game_map.dungeon_level:
+                return self.walk_towards(state, entity.x, entity.y)
+
+        return {'wait': True}
+
+    def nearest_visible_monster(self, state):
+        player = state.player
+        game_map = state.game_map
+
+        monsters = [entity for entity in game_map.entity_index.entities_within(player.x, player.y,
+                                                                               state.constants['fov_radius'])
+                    if entity.ai and game_map.fov[entity.x, entity.y]]
+
+        if not monsters:
+            return None
+
+        return min(monsters, key=player.distance_to)
+
+    def walk_towards(self, state, target_x, target_y):
+        player = state.player
+        path = state.game_map.compute_path(player.x, player.y, target_x, target_y)
+
+        if path:
+            return {'move': (path[0][0] - player.x, path[0][1] - player.y)}
+
+        return {'move': self.rng.choice(DIRECTIONS)}
+
+
+PLAYERS = {
+    'random': RandomPlayer,
+    'scripted': ScriptedPlayer
+}
+
+
+def run_game(seed, player_kind, max_turns, constants, pregenerator=None):
+    player, entities, game_map, message_log, game_state = get_game_variables(constants, run_seed=seed)
+    controller = PLAYERS[player_kind](random.Random(seed))
+
+    steps = 0
+
+    # Floors evicted from the cache go to a scratch directory instead of the player's save
+    with tempfile.TemporaryDirectory() as floor_directory:
+        dungeon = Dungeon(floor_directory, constants['floor_cache_size'], pregenerator)
+        dungeon.start(game_map.streams.run_seed, new_game=True)
+        dungeon.pregenerate_below(game_map)
+        state = TurnState(player, entities, game_map, message_log, GameStates.PLAYERS_TURN, constants, dungeon)
+
+        while state.game_state != GameStates.PLAYER_DEAD and state.turn < max_turns:
+            update_fov(state)
+            state, events = step(state, controller.next_action(state))
+            steps += 1
+
+            if any(event.get('exit') for event in events):
+                break
+
+    return {
+        'seed': seed,
+        'turns': state.turn,
+        'steps': steps,
+        'dungeon_level': state.game_map.dungeon_level,
+        'character_level': player.level.current_level,
+        'died': state.game_state == GameStates.PLAYER_DEAD
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run headless games and report turn throughput.')
+    parser.add_argument('--games', type=int, default=10, help='number of games to run')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game, later games count up from it')
+    parser.add_argument('--player', choices=sorted(PLAYERS), default='scripted')
+    parser.add_argument('--max-turns', type=int, default=5000, help='stop a game after this many turns')
+    parser.add_argument('--quiet', action='store_true', help='only print the summary')
+    parser.add_argument('--pregenerate', action='store_true',
+                        help='build floors in a background process')
+    parser.add_argument('--profile', nargs='?', const=DEFAULT_TRACE_FILE, metavar='TRACE',
+                        help='time the game phases, print a summary and write a Chrome trace to TRACE')
+    args = parser.parse_args()
+
+    if args.profile:
+        profiler.enable(args.profile)
+    else:
+        profiler.enable_from_environment()
+
+    constants = get_constants()
+    pregenerator = FloorPregenerator(constants) if args.pregenerate else None
+
+    total_turns = 0
+    start = time.perf_counter()
+
+    for i in range(args.games):
+        result = run_game(args.seed + i, args.player, args.max_turns, constants, pregenerator)
+        total_turns += result['turns']
+
+        if not args.quiet:
+            print('seed {seed}: {turns} turns, reached dungeon level {dungeon_level}, character level '
+                  '{character_level}, {0}'.format('died' if result['died'] else 'survived', **result))
+
+    elapsed = time.perf_counter() - start
+
+    if pregenerator:
+        pregenerator.shutdown()
+
+    print(f'{args.games} games, {total_turns} turns in {elapsed:.2f}s '
+          f'({total_turns / elapsed:.0f} turns per second)')
+
+    profiler.finish()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+class SpatialIndex:
+    '''
+    Hash of map positions to the entities standing on them, so positional
+    queries don't have to walk the whole entity list.
+    '''
+    def __init__(self):
+        self.cells = {}
+
+    def add(self, entity):
+        self.cells.setdefault((entity.x, entity.y), []).append(entity)
+        entity.spatial_index = self
+
+    def remove(self, entity):
+        self._discard(entity, entity.x, entity.y)
+        entity.spatial_index = None
+
+    def move(self, entity, old_x, old_y):
+        # Called after the entity's coordinates have changed
+        self._discard(entity, old_x, old_y)
+        self.cells.setdefault((entity.x, entity.y), []).append(entity)
+
+    def _discard(self, entity, x, y):
+        cell = self.cells.get((x, y))
+
+        if cell and entity in cell:
+            cell.remove(entity)
+
+            if not cell:
+                del self.cells[(x, y)]
+
+    def entities_at(self, x, y):
+        return list(self.cells.get((x, y), ()))
+
+    def blocking_entity_at(self, x, y):
+        for entity in self.cells.get((x, y), ()):
+            if entity.blocks:
+                return entity
+
+        return None
+
+    def entities_around(self, x, y, r):
+        # Everything at most r cells away along both axes. Only the cells inside that square are visited, so the
+        # cost depends on r and not on how many entities are on the floor
+        results = []
+
+        if (2 * r + 1) ** 2 > len(self.cells):
+            # Sparse floor, checking the occupied cells is cheaper than scanning the square
+            for (cx, cy), cell in self.cells.items():
+                if abs(cx - x) <= r and abs(cy - y) <= r:
+                    results.extend(cell)
+
+            return results
+
+        for cx in range(x - r, x + r + 1):
+            for cy in range(y - r, y + r + 1):
+                cell = self.cells.get((cx, cy))
+
+                if cell:
+                    results.extend(cell)
+
+        return results
+
+    def entities_within(self, x, y, radius):
+        return [entity for entity in self.entities_around(x, y, int(radius))
+                if (entity.x - x) ** 2 + (entity.y - y) ** 2 <= radius ** 2]
+
+    def rebuild(self, entities):
+        self.cells = {}
+
+        for entity in entities:
+            self.add(entity)
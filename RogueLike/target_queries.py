@@ -0,0 +1,58 @@
+import numpy as np
+
+from fov import circle_mask, symmetric_shadowcast
+
+
+def fighters_in_range(game_map, x, y, radius, occlusion=None, exclude=None):
+    '''
+    The fighters within radius of (x, y) and their coordinates as arrays. Only the cells around (x, y) are looked
+    at, then the circle, line of sight and distances are worked out for all of them at once.
+
+    occlusion is None to ignore walls, 'fov' for only fighters the player can see, or 'walls' for only fighters
+    with a line of sight to (x, y).
+    '''
+    r = int(radius)
+
+    fighters = [entity for entity in game_map.entity_index.entities_around(x, y, r)
+                if entity.fighter and entity is not exclude]
+
+    xs = np.fromiter((entity.x for entity in fighters), dtype=np.intp, count=len(fighters))
+    ys = np.fromiter((entity.y for entity in fighters), dtype=np.intp, count=len(fighters))
+
+    inside = circle_mask(radius)[xs - x + r, ys - y + r]
+
+    if occlusion == 'fov':
+        inside &= game_map.fov[xs, ys]
+    elif occlusion == 'walls':
+        window = game_map.transparent.window(x - r, y - r, x + r + 1, y + r + 1)
+        inside &= symmetric_shadowcast(window, r)[xs - x + r, ys - y + r]
+
+    indices = np.flatnonzero(inside)
+
+    return [fighters[i] for i in indices.tolist()], xs[indices], ys[indices]
+
+
+def fighters_within(game_map, x, y, radius, occlusion=None, exclude=None):
+    return fighters_in_range(game_map, x, y, radius, occlusion, exclude)[0]
+
+
+def is_hostile(entity, other):
+    # Monsters fight the player and the player fights monsters, nobody else fights each other
+    return (entity.ai is None) != (other.ai is None)
+
+
+def nearest_hostiles(game_map, entity, maximum_range, count=1, occlusion='fov'):
+    # Up to count fighters hostile to entity within maximum_range of it, nearest first
+    fighters, xs, ys = fighters_in_range(game_map, entity.x, entity.y, maximum_range, occlusion, exclude=entity)
+
+    distances = (xs - entity.x) ** 2 + (ys - entity.y) ** 2
+    nearest = []
+
+    for i in np.argsort(distances, kind='stable').tolist():
+        if is_hostile(entity, fighters[i]):
+            nearest.append(fighters[i])
+
+            if len(nearest) == count:
+                break
+
+    return nearest
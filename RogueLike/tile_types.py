@@ -0,0 +1,21 @@
+import numpy as np
+
+# Tile ids stored in GameMap.tiles
+WALL = 0
+FLOOR = 1
+
+# Per-tile lookup tables, indexed by tile id
+WALKABLE = np.array([False, True], dtype=np.bool_)
+TRANSPARENT = np.array([False, True], dtype=np.bool_)
+
+# Names of the colors (from the constants) used for a tile in and out of the field of view
+LIGHT_COLORS = ['light_wall', 'light_ground']
+DARK_COLORS = ['dark_wall', 'dark_ground']
+
+
+def tile_palettes(colors):
+    # Returns (light, dark) arrays of shape (tile count, 3) so colors can be looked up for a whole map at once
+    light = np.array([colors.get(name) for name in LIGHT_COLORS], dtype=np.uint8)
+    dark = np.array([colors.get(name) for name in DARK_COLORS], dtype=np.uint8)
+
+    return light, dark
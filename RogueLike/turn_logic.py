@@ -0,0 +1,322 @@
+from death_functions import kill_monster, kill_player
+from fov import get_fov_engine
+from game_messages import Message
+from game_states import GameStates
+from profiling import profiled
+
+
+class TurnState:
+    '''
+    Everything a turn needs, without any reference to the window or consoles.
+    '''
+    def __init__(self, player, entities, game_map, message_log, game_state, constants, dungeon):
+        self.player = player
+        self.entities = entities
+        self.game_map = game_map
+        self.message_log = message_log
+        self.game_state = game_state
+        self.previous_game_state = game_state
+        self.targeting_item = None
+        self.constants = constants
+        self.dungeon = dungeon
+        self.fov_recompute = True
+        self.turn = 0
+
+
+@profiled('fov')
+def update_fov(state):
+    # Recompute the player's field of view if the last step asked for it, returns whether it did
+    if not state.fov_recompute:
+        return False
+
+    constants = state.constants
+    state.game_map.update_fov(state.player.x, state.player.y, get_fov_engine(constants['fov_algorithm']),
+                              constants['fov_radius'], constants['fov_light_walls'])
+    state.fov_recompute = False
+
+    # Monsters wake up as soon as the player can see them
+    state.game_map.wake_visible_entities(state.player.x, state.player.y, constants['fov_radius'])
+
+    return True
+
+
+def step(state, action):
+    '''
+    Advance the game by one input. `action` is the merged dict produced by the key and mouse handlers.
+    Returns the state and a list of event dicts for whoever is driving the game (renderer, simulator).
+    '''
+    events = []
+
+    player = state.player
+    game_map = state.game_map
+    message_log = state.message_log
+    constants = state.constants
+
+    move = action.get('move')
+    wait = action.get('wait')
+    pickup = action.get('pickup')
+    show_inventory = action.get('show_inventory')
+    drop_inventory = action.get('drop_inventory')
+    inventory_index = action.get('inventory_index')
+    take_stairs = action.get('take_stairs')
+    level_up = action.get('level_up')
+    show_character_screen = action.get('show_character_screen')
+    show_message_history = action.get('show_message_history')
+    scroll_history = action.get('scroll_history')
+    exit = action.get('exit')
+    fullscreen = action.get('fullscreen')
+
+    left_click = action.get('left_click')
+    right_click = action.get('right_click')
+
+    player_turn_results = []
+
+    if move and state.game_state == GameStates.PLAYERS_TURN:
+        dx, dy = move
+        destination_x = player.x + dx
+        destination_y = player.y + dy
+
+        if game_map.walkable[destination_x, destination_y]:
+            target = game_map.entity_index.blocking_entity_at(destination_x, destination_y)
+
+            if target:
+                attack_results = player.fighter.attack(target)
+                player_turn_results.extend(attack_results)
+                player_turn_results.append({'noise': (player.x, player.y, constants['noise_radius'])})
+            else:
+                player.move(dx, dy)
+                state.fov_recompute = True
+
+            state.game_state = GameStates.ENEMY_TURN
+
+    elif wait:
+        state.game_state = GameStates.ENEMY_TURN
+
+    elif pickup and state.game_state == GameStates.PLAYERS_TURN:
+        for entity in game_map.entity_index.entities_at(player.x, player.y):
+            if entity.item:
+                pickup_results = player.inventory.add_item(entity, constants['colors'])
+                player_turn_results.extend(pickup_results)
+
+                break
+        else:
+            message_log.add_message(Message('There is nothing here to pick up.', constants['colors'].get('yellow')))
+
+    if show_inventory:
+        state.previous_game_state = state.game_state
+        state.game_state = GameStates.SHOW_INVENTORY
+
+    if drop_inventory:
+        state.previous_game_state = state.game_state
+        state.game_state = GameStates.DROP_INVENTORY
+
+    if inventory_index is not None and state.previous_game_state != GameStates.PLAYER_DEAD and inventory_index < len(
+            player.inventory.items):
+        item = player.inventory.items[inventory_index]
+
+        if state.game_state == GameStates.SHOW_INVENTORY:
+            player_turn_results.extend(player.inventory.use(item, constants['colors'], entities=state.entities,
+                                                            game_map=game_map))
+        elif state.game_state == GameStates.DROP_INVENTORY:
+            player_turn_results.extend(player.inventory.drop_item(item, constants['colors']))
+
+    if take_stairs and state.game_state == GameStates.PLAYERS_TURN:
+        for entity in game_map.entity_index.entities_at(player.x, player.y):
+            if entity.stairs:
+                state.game_map, state.entities = state.dungeon.change_floor(player, state.entities, game_map,
+                                                                            message_log, entity.stairs.floor,
+                                                                            constants)
+                game_map = state.game_map
+                state.fov_recompute = True
+                events.append({'new_floor': game_map})
+
+                break
+        else:
+            message_log.add_message(Message('There are no stairs here.', constants['colors'].get('yellow')))
+
+    if level_up:
+        if level_up == 'hp':
+            player.fighter.base_max_hp += 20
+            player.fighter.hp += 20
+        elif level_up == 'str':
+            player.fighter.base_power += 1
+        elif level_up == 'def':
+            player.fighter.base_defense += 1
+
+        player.fighter.update_stats()
+
+        state.game_state = state.previous_game_state
+
+    if show_character_screen:
+        state.previous_game_state = state.game_state
+        state.game_state = GameStates.CHARACTER_SCREEN
+
+    if show_message_history:
+        state.previous_game_state = state.game_state
+        state.game_state = GameStates.MESSAGE_HISTORY
+        message_log.scroll_offset = 0
+
+    if scroll_history:
+        message_log.scroll(scroll_history)
+
+    if state.game_state == GameStates.TARGETING:
+        if left_click:
+            target_x, target_y = left_click
+
+            item_use_results = player.inventory.use(state.targeting_item, constants['colors'], entities=state.entities,
+                                                    game_map=game_map, target_x=target_x, target_y=target_y)
+            player_turn_results.extend(item_use_results)
+        elif right_click:
+            player_turn_results.append({'targeting_cancelled': True})
+
+    if exit:
+        if state.game_state in (GameStates.SHOW_INVENTORY, GameStates.DROP_INVENTORY, GameStates.CHARACTER_SCREEN,
+                                GameStates.MESSAGE_HISTORY):
+            state.game_state = state.previous_game_state
+        elif state.game_state == GameStates.TARGETING:
+            player_turn_results.append({'targeting_cancelled': True})
+        else:
+            events.append({'exit': True})
+
+            return state, events
+
+    if fullscreen:
+        events.append({'fullscreen': True})
+
+    process_player_turn_results(state, player_turn_results)
+
+    if state.game_state == GameStates.ENEMY_TURN:
+        take_enemy_turn(state)
+
+    return state, events
+
+
+@profiled('player_results')
+def process_player_turn_results(state, player_turn_results):
+    player = state.player
+    message_log = state.message_log
+    constants = state.constants
+
+    for player_turn_result in player_turn_results:
+        message = player_turn_result.get('message')
+        dead_entity = player_turn_result.get('dead')
+        item_added = player_turn_result.get('item_added')
+        item_consumed = player_turn_result.get('consumed')
+        item_dropped = player_turn_result.get('item_dropped')
+        equip = player_turn_result.get('equip')
+        targeting = player_turn_result.get('targeting')
+        targeting_cancelled = player_turn_result.get('targeting_cancelled')
+        xp = player_turn_result.get('xp')
+        wake = player_turn_result.get('wake')
+        noise = player_turn_result.get('noise')
+
+        if message:
+            message_log.add_message(message)
+
+        if dead_entity:
+            if dead_entity == player:
+                message, state.game_state = kill_player(dead_entity, constants['colors'])
+            else:
+                message = kill_monster(dead_entity, constants['colors'])
+
+            message_log.add_message(message)
+
+        if wake:
+            state.game_map.wake(wake)
+
+        if noise:
+            state.game_map.wake_entities_near(*noise)
+
+        if item_added:
+            state.game_map.remove_entity(state.entities, item_added)
+
+            state.game_state = GameStates.ENEMY_TURN
+
+        if item_consumed:
+            state.game_state = GameStates.ENEMY_TURN
+
+        if item_dropped:
+            state.game_map.add_entity(state.entities, item_dropped)
+
+            state.game_state = GameStates.ENEMY_TURN
+
+        if equip:
+            equip_results = player.equipment.toggle_equip(equip)
+
+            for equip_result in equip_results:
+                equipped = equip_result.get('equipped')
+                dequipped = equip_result.get('dequipped')
+
+                if equipped:
+                    message_log.add_message(Message(f'You equipped the {equipped.name}'))
+
+                if dequipped:
+                    message_log.add_message(Message(f'You dequipped the {dequipped.name}'))
+
+            state.game_state = GameStates.ENEMY_TURN
+
+        if targeting:
+            state.previous_game_state = GameStates.PLAYERS_TURN
+            state.game_state = GameStates.TARGETING
+
+            state.targeting_item = targeting
+
+            message_log.add_message(state.targeting_item.item.targeting_message)
+
+        if targeting_cancelled:
+            state.game_state = state.previous_game_state
+
+            message_log.add_message(Message('Targeting cancelled'))
+
+        if xp:
+            leveled_up = player.level.add_xp(xp)
+            message_log.add_message(Message(
+                'You gain {0} experience points.'.format(xp)))
+
+            if leveled_up:
+                message_log.add_message(Message(
+                    'Your battle skills grow stronger! You reached level {0}'.format(player.level.current_level) + '!',
+                    constants['colors'].get('yellow')))
+                state.previous_game_state = state.game_state
+                state.game_state = GameStates.LEVEL_UP
+
+
+@profiled('enemy_turn')
+def take_enemy_turn(state):
+    player = state.player
+    game_map = state.game_map
+    message_log = state.message_log
+    constants = state.constants
+
+    # Only awake monsters take a turn, everything else costs nothing until it is woken
+    for entity in list(game_map.awake_entities):
+        if entity.ai:
+            enemy_turn_results = entity.ai.take_turn(player, game_map, state.entities)
+
+            for enemy_turn_result in enemy_turn_results:
+                message = enemy_turn_result.get('message')
+                dead_entity = enemy_turn_result.get('dead')
+
+                if message:
+                    message_log.add_message(message)
+
+                if dead_entity:
+                    if dead_entity == player:
+                        message, state.game_state = kill_player(dead_entity, constants['colors'])
+                    else:
+                        message = kill_monster(dead_entity, constants['colors'])
+
+                    message_log.add_message(message)
+
+                    if state.game_state == GameStates.PLAYER_DEAD:
+                        break
+
+        if not entity.ai or not entity.ai.awake:
+            game_map.awake_entities.pop(entity, None)
+
+        if state.game_state == GameStates.PLAYER_DEAD:
+            break
+    else:
+        state.game_state = GameStates.PLAYERS_TURN
+
+    state.turn += 1